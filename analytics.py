@@ -0,0 +1,250 @@
+import argparse
+import datetime
+import json
+import os
+import threading
+import numpy as np
+from attempt_log import ATTEMPT_LOG, read_attempts
+
+# Post-event statistics over the whole attempt history. attempts.csv is
+# converted once into fixed-width binary columns under ANALYTICS_DIR, which
+# are then memory-mapped, so every aggregate below is a handful of NumPy
+# calls instead of a Python loop over hundreds of thousands of tuples. New
+# attempts are appended to the columns incrementally by refresh().
+
+ANALYTICS_DIR = "analytics"
+COLUMNS = {
+    "time_us": np.float64,
+    "host_ns": np.int64,
+    "player": np.int32,
+    "station": np.int32,
+}
+META_FILE = "meta.json"
+PERIODS = {"hour": 3600, "day": 86400}
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+
+class AttemptColumns:
+    # Players and stations are dictionary-encoded: the columns hold indexes
+    # into the players/stations lists kept in meta.json.
+    def __init__(self, source=ATTEMPT_LOG, directory=ANALYTICS_DIR):
+        self.source = source
+        self.directory = directory
+        self.players = []
+        self.stations = []
+        self.count = 0
+        self._offset = 0
+        self._player_ids = {}
+        self._station_ids = {}
+        self._columns = {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_meta()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_meta(self):
+        try:
+            with open(self._path(META_FILE)) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        self.players = [tuple(p) for p in meta["players"]]
+        self.stations = meta["stations"]
+        self.count = meta["count"]
+        self._offset = meta["source_offset"]
+        self._player_ids = {p: i for i, p in enumerate(self.players)}
+        self._station_ids = {s: i for i, s in enumerate(self.stations)}
+        self._map()
+
+    def _save_meta(self):
+        meta = {
+            "count": self.count,
+            "source_offset": self._offset,
+            "players": self.players,
+            "stations": self.stations,
+        }
+        tmp = self._path(META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path(META_FILE))
+
+    def _map(self):
+        for name, dtype in COLUMNS.items():
+            if self.count:
+                self._columns[name] = np.memmap(self._path(name + ".bin"), dtype=dtype, mode="r", shape=(self.count,))
+            else:
+                self._columns[name] = np.empty(0, dtype)
+
+    def _reset(self):
+        self.players, self.stations = [], []
+        self._player_ids, self._station_ids = {}, {}
+        self.count = self._offset = 0
+        for name in COLUMNS:
+            # Unlink rather than truncate so arrays already handed out by
+            # columns() keep their (old) data mapped.
+            try:
+                os.remove(self._path(name + ".bin"))
+            except FileNotFoundError:
+                pass
+
+    def refresh(self):
+        # Appends attempts written since the last call. Returns how many were added.
+        with self._lock:
+            try:
+                size = os.path.getsize(self.source)
+            except FileNotFoundError:
+                size = 0
+            if size < self._offset:
+                # The attempt log was replaced or truncated: rebuild from scratch.
+                self._reset()
+            if size == self._offset:
+                return 0
+
+            rows = {name: [] for name in COLUMNS}
+            offset = self._offset
+            for (time_us, name, roll, host_ns, station), offset in read_attempts(self.source, self._offset):
+                player = self._player_ids.get((name, roll))
+                if player is None:
+                    player = self._player_ids[(name, roll)] = len(self.players)
+                    self.players.append((name, roll))
+                station_id = self._station_ids.get(station)
+                if station_id is None:
+                    station_id = self._station_ids[station] = len(self.stations)
+                    self.stations.append(station)
+                rows["time_us"].append(time_us)
+                rows["host_ns"].append(host_ns)
+                rows["player"].append(player)
+                rows["station"].append(station_id)
+
+            added = len(rows["time_us"])
+            if added:
+                self._columns = {}
+                for name, dtype in COLUMNS.items():
+                    with open(self._path(name + ".bin"), "ab") as f:
+                        # Drop anything past the committed count left by a crash
+                        # between writing the columns and meta.json.
+                        f.truncate(self.count * np.dtype(dtype).itemsize)
+                        f.write(np.asarray(rows[name], dtype=dtype).tobytes())
+                self.count += added
+            self._offset = max(offset, self._offset)
+            self._save_meta()
+            self._map()
+            return added
+
+    def columns(self):
+        with self._lock:
+            return dict(self._columns), list(self.players), list(self.stations)
+
+    def summary(self):
+        cols, players, stations = self.columns()
+        times = cols["time_us"]
+        if not len(times):
+            return {"attempts": 0, "players": 0, "stations": 0}
+        return {
+            "attempts": int(len(times)),
+            "players": len(np.unique(cols["player"])),
+            "stations": len(stations),
+            "best_us": float(times.min()),
+            "mean_us": float(times.mean()),
+            "percentiles": self.percentiles(DEFAULT_PERCENTILES),
+            "first_ns": int(cols["host_ns"].min()),
+            "last_ns": int(cols["host_ns"].max()),
+        }
+
+    def percentiles(self, points=DEFAULT_PERCENTILES):
+        times = self.columns()[0]["time_us"]
+        if not len(times):
+            return {}
+        values = np.percentile(times, points)
+        return {f"p{p:g}": float(v) for p, v in zip(points, values)}
+
+    def histogram(self, bins=50, low=None, high=None):
+        times = self.columns()[0]["time_us"]
+        if not len(times):
+            return {"counts": [], "edges": []}
+        low = float(times.min()) if low is None else low
+        high = float(times.max()) if high is None else high
+        counts, edges = np.histogram(times, bins=bins, range=(low, high))
+        return {"counts": counts.tolist(), "edges": edges.tolist()}
+
+    def personal_bests(self, limit=None):
+        cols, players, _ = self.columns()
+        times, player = cols["time_us"], cols["player"]
+        if not len(times):
+            return []
+        # Sort by player, then time: the first row of each player is their best.
+        order = np.lexsort((times, player))
+        sorted_players = player[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sorted_players[1:] != sorted_players[:-1]
+        best_rows = order[first]
+        attempts = np.bincount(player, minlength=len(players))
+        best_rows = best_rows[np.argsort(times[best_rows], kind="stable")][:limit]
+        return [self._row(cols, players, row, attempts=int(attempts[player[row]])) for row in best_rows]
+
+    def period_leaderboards(self, period="day", n=10, limit=None):
+        # Best n players within each hour/day (local time), newest period first.
+        cols, players, _ = self.columns()
+        times, player = cols["time_us"], cols["player"]
+        if not len(times):
+            return []
+        seconds = PERIODS[period]
+        utc_offset = int(datetime.datetime.now().astimezone().utcoffset().total_seconds())
+        bucket = (cols["host_ns"] // 1_000_000_000 + utc_offset) // seconds
+
+        # Each player's best in each period...
+        order = np.lexsort((times, player, bucket))
+        keys = np.stack((bucket[order], player[order]))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = np.any(keys[:, 1:] != keys[:, :-1], axis=0)
+        best_rows = order[first]
+        # ...then ranked within the period, keeping the top n of each.
+        best_rows = best_rows[np.lexsort((times[best_rows], -bucket[best_rows]))]
+        best_buckets = bucket[best_rows]
+        starts = np.flatnonzero(np.r_[True, best_buckets[1:] != best_buckets[:-1]])
+        ends = np.r_[starts[1:], len(best_rows)]
+
+        boards = []
+        for start, end in list(zip(starts, ends))[:limit]:
+            rows = best_rows[start:min(end, start + n)]
+            begins = datetime.datetime.fromtimestamp(int(best_buckets[start]) * seconds - utc_offset)
+            boards.append({
+                "period": begins.strftime("%Y-%m-%d %H:00" if period == "hour" else "%Y-%m-%d"),
+                "leaderboard": [self._row(cols, players, row) for row in rows],
+            })
+        return boards
+
+    def _row(self, cols, players, row, **extra):
+        name, roll = players[cols["player"][row]]
+        return {
+            "time": float(cols["time_us"][row]),
+            "name": name,
+            "roll": roll,
+            "timestamp": datetime.datetime.fromtimestamp(int(cols["host_ns"][row]) / 1e9).strftime('%Y-%m-%d %H:%M:%S'),
+            **extra,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the analytics columns from the attempt log and print a report.")
+    parser.add_argument("--source", default=ATTEMPT_LOG)
+    parser.add_argument("--dir", default=ANALYTICS_DIR)
+    parser.add_argument("--top", type=int, default=10, help="players in each leaderboard")
+    parser.add_argument("--period", choices=sorted(PERIODS), default="day")
+    args = parser.parse_args()
+
+    columns = AttemptColumns(args.source, args.dir)
+    added = columns.refresh()
+    report = {
+        "added": added,
+        "summary": columns.summary(),
+        "personal_bests": columns.personal_bests(args.top),
+        "leaderboards": columns.period_leaderboards(args.period, args.top),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
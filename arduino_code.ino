@@ -2,10 +2,81 @@
 // Change this to match your wiring if needed.
 const int TOUCH_SENSOR_PIN = 2;
 
+// Set to 1 to use the binary protocol (v2) at 115200 baud instead of text
+// lines at 9600 baud. Tell f1.py which one each rig speaks, e.g.
+// F1_STATIONS="1=COM7:v2". See protocol.py for the frame layout.
+#define PROTOCOL_V2 0
+
+#if PROTOCOL_V2
+const long BAUD_RATE = 115200;
+#else
+const long BAUD_RATE = 9600;
+#endif
+
+// v2 frame: 0xAA | type | seq | len | payload | CRC-8 of type..payload
+const byte FRAME_SYNC = 0xAA;
+const byte MSG_HELLO = 0x01;
+const byte MSG_COUNTDOWN = 0x02;
+const byte MSG_RESULT = 0x03;
+byte frameSeq = 0;
+
+byte crc8(const byte *data, byte len) {
+  // CRC-8/SMBUS: polynomial 0x07, initial value 0.
+  byte crc = 0;
+  for (byte i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (byte bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendFrame(byte type, const byte *payload, byte len) {
+  byte frame[5 + 4];
+  frame[0] = FRAME_SYNC;
+  frame[1] = type;
+  frame[2] = frameSeq++;
+  frame[3] = len;
+  for (byte i = 0; i < len; i++) {
+    frame[4 + i] = payload[i];
+  }
+  frame[4 + len] = crc8(frame + 1, 3 + len);
+  Serial.write(frame, 5 + len);
+}
+
+void sendCountdown(byte digit) {
+#if PROTOCOL_V2
+  sendFrame(MSG_COUNTDOWN, &digit, 1);
+#else
+  Serial.println(digit);
+#endif
+}
+
+void sendResult(unsigned long reactionTime) {
+#if PROTOCOL_V2
+  // Little-endian, as protocol.py expects.
+  byte payload[4] = {
+    (byte)(reactionTime), (byte)(reactionTime >> 8),
+    (byte)(reactionTime >> 16), (byte)(reactionTime >> 24)
+  };
+  sendFrame(MSG_RESULT, payload, 4);
+#else
+  // Format the time as a JSON string and send it to your Python script.
+  Serial.print("{\"time_us\":");
+  Serial.print(reactionTime);
+  Serial.println("}");
+#endif
+}
+
 void setup() {
-  // Start serial communication at 9600 baud rate.
-  Serial.begin(9600);
+  // Start serial communication at the protocol's baud rate.
+  Serial.begin(BAUD_RATE);
   pinMode(TOUCH_SENSOR_PIN, INPUT);
+#if PROTOCOL_V2
+  byte version = 2;
+  sendFrame(MSG_HELLO, &version, 1);
+#endif
 }
 
 void loop() {
@@ -17,13 +88,13 @@ void loop() {
     if (command == 'S') {
       
       // Start the countdown. The Python script will display this.
-      Serial.println("3");
+      sendCountdown(3);
       delay(1000); 
 
-      Serial.println("2");
+      sendCountdown(2);
       delay(1000); 
 
-      Serial.println("1");
+      sendCountdown(1);
       delay(1000); 
 
       // Start the timer immediately after the countdown.
@@ -42,10 +113,7 @@ void loop() {
       // Stop the timer and calculate the reaction time.
       unsigned long reactionTime = micros() - startTime;
       
-      // Format the time as a JSON string and send it to your Python script.
-      Serial.print("{\"time_us\":");
-      Serial.print(reactionTime);
-      Serial.println("}");
+      sendResult(reactionTime);
     }
   }
 }
\ No newline at end of file
@@ -0,0 +1,111 @@
+import argparse
+import os
+import pty
+import random
+import threading
+import time
+import tty
+from protocol import MSG_COUNTDOWN, MSG_HELLO, MSG_RESULT, encode_frame
+
+# Software stand-in for the board running arduino_code.ino. It exposes a
+# pseudo-terminal that f1.py opens like a real serial port, answers each 'S'
+# with "3", "2", "1" and then {"time_us":...}, and lets the countdown pace and
+# reaction time be tuned. With protocol="v2" it speaks the binary framing
+# from protocol.py instead. POSIX only (uses pty).
+
+
+class SimulatedArduino:
+    def __init__(self, countdown=1.0, reaction_ms=250.0, jitter_ms=50.0, seed=None, protocol="v1"):
+        self.countdown = countdown
+        self.protocol = protocol
+        self._seq = 0
+        self.reaction_ms = reaction_ms
+        self.jitter_ms = jitter_ms
+        self.games = 0
+        self._rng = random.Random(seed)
+        self._master, self._slave = pty.openpty()
+        # Raw mode: no echo of 'S' back to the host and no newline rewriting.
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._closed = False
+
+    def start(self):
+        if self.protocol == "v2":
+            self._frame(MSG_HELLO, bytes((2,)))
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def close(self):
+        self._closed = True
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def reaction_time_us(self):
+        reaction_ms = self._rng.gauss(self.reaction_ms, self.jitter_ms) if self.jitter_ms else self.reaction_ms
+        return max(1, round(reaction_ms * 1000))
+
+    def _send(self, line):
+        os.write(self._master, (line + "\r\n").encode())
+
+    def _frame(self, msg_type, payload):
+        os.write(self._master, encode_frame(msg_type, self._seq, payload))
+        self._seq = (self._seq + 1) & 0xFF
+
+    def _play(self):
+        for digit in (3, 2, 1):
+            if self.protocol == "v2":
+                self._frame(MSG_COUNTDOWN, bytes((digit,)))
+            else:
+                self._send(str(digit))
+            time.sleep(self.countdown)
+        reaction_us = self.reaction_time_us()
+        time.sleep(reaction_us / 1_000_000)
+        if self.protocol == "v2":
+            self._frame(MSG_RESULT, reaction_us.to_bytes(4, "little"))
+        else:
+            self._send('{"time_us":%d}' % reaction_us)
+        self.games += 1
+
+    def _run(self):
+        while not self._closed:
+            try:
+                data = os.read(self._master, 64)
+            except OSError:
+                return
+            # Like the firmware, each 'S' starts one full game in turn.
+            for _ in range(data.count(b"S")):
+                self._play()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the F1 reaction timer Arduino on a pseudo-terminal.")
+    parser.add_argument("--devices", type=int, default=1, help="number of simulated rigs")
+    parser.add_argument("--countdown", type=float, default=1.0, help="seconds between countdown digits")
+    parser.add_argument("--reaction-ms", type=float, default=250.0, help="mean reaction time")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="standard deviation of the reaction time")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--protocol", choices=["v1", "v2"], default="v1")
+    args = parser.parse_args()
+
+    devices = [
+        SimulatedArduino(args.countdown, args.reaction_ms, args.jitter_ms,
+                         None if args.seed is None else args.seed + i, args.protocol).start()
+        for i in range(args.devices)
+    ]
+    spec = ",".join(f"{i + 1}={device.port}:{args.protocol}" for i, device in enumerate(devices))
+    print(f"Simulated Arduino ready. Run the game with:\n  F1_STATIONS=\"{spec}\" python f1.py")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for device in devices:
+            device.close()
+
+
+if __name__ == "__main__":
+    main()
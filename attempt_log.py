@@ -0,0 +1,116 @@
+import csv
+import io
+import os
+import queue
+import threading
+import time
+from metrics import Histogram
+
+ATTEMPT_LOG = "attempts.csv"
+ATTEMPT_FIELDS = ["time_us", "name", "roll", "host_ns", "station"]
+MAX_BATCH = 1024
+
+commit_latency = Histogram("f1_attempt_commit_seconds", "Time to write and fsync one batch of attempts.")
+batch_size = Histogram("f1_attempt_batch_size", "Attempts committed per fsync.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+
+
+def parse_attempt(row):
+    # row is a list of CSV fields; returns None for the header or bad rows.
+    if len(row) != len(ATTEMPT_FIELDS):
+        return None
+    try:
+        return (float(row[0]), row[1], row[2], int(row[3]), row[4])
+    except ValueError:
+        return None
+
+
+def read_attempts(path=ATTEMPT_LOG, offset=0):
+    # Yields (attempt, end_offset) for every complete record from offset on.
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            for row in csv.reader([line.decode(errors="ignore")]):
+                attempt = parse_attempt(row)
+                if attempt is not None:
+                    yield attempt, offset
+
+
+class AttemptWriter:
+    # Every run is appended to ATTEMPT_LOG, not just top-10 candidates.
+    # record() only enqueues, so the serial path never waits on the disk; the
+    # writer thread drains whatever has queued up and commits it as one
+    # write + fsync (group commit), so batches grow with the arrival rate.
+    def __init__(self, path=ATTEMPT_LOG):
+        self.path = path
+        self.written = 0
+        self.batches = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def record(self, time_us, name, roll, station, host_ns=None):
+        attempt = (time_us, name, roll, host_ns or time.time_ns(), station)
+        self._queue.put(attempt)
+        return attempt
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _open(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        f = open(self.path, "ab")
+        if size == 0:
+            f.write((",".join(ATTEMPT_FIELDS) + "\n").encode())
+        else:
+            with open(self.path, "rb") as existing:
+                existing.seek(size - 1)
+                if existing.read(1) != b"\n":
+                    # Terminate a record torn by a crash.
+                    f.write(b"\n")
+        return f
+
+    def _run(self):
+        with self._open() as f:
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                while len(batch) < MAX_BATCH:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    stopping = True
+                    batch = [a for a in batch if a is not None]
+                if not batch:
+                    continue
+
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator="\n")
+                writer.writerows(batch)
+                try:
+                    with commit_latency.time():
+                        f.write(buffer.getvalue().encode())
+                        f.flush()
+                        os.fsync(f.fileno())
+                except OSError as e:
+                    print(f"Error writing attempt log: {e}")
+                    continue
+                self.written += len(batch)
+                self.batches += 1
+                batch_size.observe(len(batch))
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from arduino_sim import SimulatedArduino
+from leaderboard_store import LEADERBOARD_FILE, format_entry
+
+# End-to-end benchmark for f1.py against simulated rigs:
+# /player -> /set_stage/waiting -> serial -> /stage -> leaderboard persist.
+# Runs in a scratch directory so the real leaderboard and images are untouched.
+# With --startup it instead launches f1.py as a separate process and times
+# how soon it serves pages and finishes its first game.
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def seed_leaderboard(path, count, rng):
+    times = sorted(rng.uniform(100_000, 500_000) for _ in range(count))
+    with open(path, "w") as f:
+        for i, t in enumerate(times):
+            f.write(format_entry((t, f"seed{i}", str(i), "2025-01-01 00:00:00", "N/A")))
+
+
+def trace_station(station, result_stages):
+    # The stream only carries the latest stage, so a short-lived result can
+    # be coalesced away. Stamp result stages and leaderboard saves on the
+    # station's own loop thread instead.
+    trace = {"shown": [], "persist": []}
+    update_stage, save_entry = station.update_stage, station.save_entry
+
+    def traced_update_stage(stage_type, value=None, **extra):
+        update_stage(stage_type, value, **extra)
+        if stage_type in result_stages:
+            trace["shown"].append(time.perf_counter())
+
+    def traced_save_entry(entry):
+        started = time.perf_counter()
+        save_entry(entry)
+        trace["persist"].append(time.perf_counter() - started)
+
+    station.update_stage = traced_update_stage
+    station.save_entry = traced_save_entry
+    return trace
+
+
+def run_station(app, station_id, runs, trace, timings):
+    client = app.test_client()
+    query = f"?station={station_id}"
+    # Follow the stage the way the game page does, over /stage/stream.
+    stream = client.get("/stage/stream" + query, buffered=False)
+    stages = (json.loads(chunk[len(b"data: "):]) for chunk in stream.response if chunk.startswith(b"data: "))
+    next(stages)
+    for i in range(runs):
+        started = time.perf_counter()
+        client.post("/player" + query, json={"name": f"bench{station_id}", "roll": str(i)})
+        client.get("/set_stage/waiting" + query)
+        requested = time.perf_counter()
+        saves = len(trace["persist"])
+        # With RESULT_SECONDS at 0 the station's loop expires the result
+        # straight away, which persists a new record and returns it to the
+        # landing page.
+        for stage in stages:
+            if stage["type"] == "landing":
+                break
+        done = time.perf_counter()
+        timings["start"].append(requested - started)
+        timings["result"].append(trace["shown"][-1] - requested)
+        if len(trace["persist"]) > saves:
+            # Only results that made the board are saved to it.
+            timings["persist"].append(trace["persist"][-1])
+        timings["total"].append(done - started)
+    stream.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def http_get(url, deadline, data=None):
+    # Retries until the server answers, for up to `deadline`.
+    while True:
+        try:
+            headers = {"Content-Type": "application/json"} if data is not None else {}
+            with urllib.request.urlopen(urllib.request.Request(url, data, headers), timeout=1) as r:
+                return r.read()
+        except (urllib.error.URLError, ConnectionError):
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.002)
+
+
+def measure_startup(runs, result_stages):
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, F1_HTTP_PORT=str(free_port()), PYTHONPATH=here)
+    base = f"http://127.0.0.1:{env['F1_HTTP_PORT']}"
+    timings = {"import": [], "first page": [], "first result": []}
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", "import time; t = time.perf_counter(); import f1; print(time.perf_counter() - t)"],
+                             env=env, capture_output=True, text=True, check=True).stdout
+        timings["import"].append(float(out.split()[-1]))
+
+        started = time.perf_counter()
+        server = subprocess.Popen([sys.executable, os.path.join(here, "f1.py")], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = started + 60
+            http_get(base + "/", deadline)
+            timings["first page"].append(time.perf_counter() - started)
+            http_get(base + "/player", deadline, json.dumps({"name": "startup", "roll": "0"}).encode())
+            http_get(base + "/set_stage/waiting", deadline)
+            while json.loads(http_get(base + "/stage", deadline))["type"] not in result_stages:
+                time.sleep(0.002)
+            timings["first result"].append(time.perf_counter() - started)
+        finally:
+            server.terminate()
+            server.wait()
+    return timings
+
+
+def report(name, values):
+    print(f"  {name:<12} p50 {percentile(values, 50) * 1000:8.3f} ms   "
+          f"p99 {percentile(values, 99) * 1000:8.3f} ms   max {max(values, default=0) * 1000:8.3f} ms")
+
+
+def finish(args, devices, workdir):
+    for device in devices:
+        device.close()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if args.keep:
+        print(f"Scratch directory kept at {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the F1 game server against simulated Arduinos.")
+    parser.add_argument("--stations", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=200, help="games per station")
+    parser.add_argument("--seed-entries", type=int, default=0, help="pre-seed the leaderboard with this many entries")
+    parser.add_argument("--countdown", type=float, default=0.0, help="simulated seconds between countdown digits")
+    parser.add_argument("--reaction-ms", type=float, default=0.2, help="simulated mean reaction time")
+    parser.add_argument("--jitter-ms", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--protocol", choices=["v1", "v2"], default="v1", help="serial protocol the rigs speak")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--startup", action="store_true", help="time process startup instead of throughput (--runs launches)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    devices = [
+        SimulatedArduino(args.countdown, args.reaction_ms, args.jitter_ms, args.seed + i, args.protocol).start()
+        for i in range(args.stations)
+    ]
+    workdir = tempfile.mkdtemp(prefix="f1-bench-")
+    os.chdir(workdir)
+    if args.seed_entries:
+        seed_leaderboard(LEADERBOARD_FILE, args.seed_entries, rng)
+
+    # Rigs without webcams (@-1), so no real camera is opened.
+    os.environ["F1_STATIONS"] = ",".join(f"{i + 1}={d.port}@-1:{args.protocol}" for i, d in enumerate(devices))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import station
+
+    if args.startup:
+        timings = measure_startup(args.runs, station.RESULT_STAGES)
+        print(f"{args.runs} launches of f1.py, {args.seed_entries} seeded entries")
+        for name, values in timings.items():
+            report(name, values)
+        finish(args, devices, workdir)
+        return
+
+    import f1
+
+    station.RESULT_SECONDS = 0
+    started = time.perf_counter()
+    f1.leaderboard.load()
+    load_time = time.perf_counter() - started
+    f1.ranks.load_attempt_log()
+    f1.attempts.start()
+    f1.stations.start()
+
+    timings = {"start": [], "result": [], "persist": [], "total": []}
+    threads = [
+        threading.Thread(target=run_station, args=(f1.app, s.id, args.runs, trace_station(s, station.RESULT_STAGES), timings))
+        for s in f1.stations
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    f1.leaderboard.close()
+    f1.attempts.close()
+
+    games = len(timings["total"])
+    print(f"{games} games on {args.stations} station(s) over protocol {args.protocol}, {args.seed_entries} seeded entries "
+          f"(loaded in {load_time * 1000:.1f} ms)")
+    print(f"  throughput   {games / elapsed:8.1f} results/s")
+    for name in ("start", "result", "persist", "total"):
+        report(name, timings[name])
+    print(f"  saved        {len(timings['persist'])} of {games} results made the board")
+    print(f"  attempts     {f1.attempts.written} written in {f1.attempts.batches} batches")
+    for s in f1.stations:
+        stats = s.serial_stats()
+        print(f"  station {s.id} serial line -> stage: mean {stats['mean_us']:.1f} us, "
+              f"max {stats['max_us']:.1f} us, dropped {stats['dropped']}, "
+              f"decode errors {stats['decode_errors']}, lost frames {stats['lost_frames']}")
+
+    finish(args, devices, workdir)
+
+
+if __name__ == "__main__":
+    main()
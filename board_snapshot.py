@@ -0,0 +1,191 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from leaderboard_store import TOP_N
+
+# f1.py publishes the current top-N into a small memory-mapped file that
+# leaderboard.py maps read-only, so the display never has to parse the
+# leaderboard files or query the database to find out what changed.
+#
+# Layout (little-endian), a 32-byte header followed by `capacity` slots:
+#   magic "F1SN" | layout u16 | capacity u16 | seq u64 | version u64 | count u32 | pad u32
+#   slot: time_us f64 | name 64s | roll 32s | timestamp 24s | image 128s
+# Strings are UTF-8, NUL padded and cut to fit, except the image name: one
+# that does not fit is left empty (no photo) rather than cut into a name that
+# never resolves; station.py keeps photo names well inside it.
+# seq is a seqlock: the writer makes it odd before touching the slots and
+# even again afterwards, so a reader that sees the same even seq before and
+# after its read knows the slots were not being rewritten underneath it.
+# version counts publishes.
+# Set F1_SNAPSHOT to another path to move the file, or to "" to disable it.
+SNAPSHOT_FILE = os.environ.get("F1_SNAPSHOT", "leaderboard.snap")
+MAGIC = b"F1SN"
+LAYOUT = 1
+HEADER = struct.Struct("<4sHHQQII")
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+NAME_BYTES = 64
+ROLL_BYTES = 32
+TIMESTAMP_BYTES = 24
+IMAGE_BYTES = 128
+ENTRY = struct.Struct(f"<d{NAME_BYTES}s{ROLL_BYTES}s{TIMESTAMP_BYTES}s{IMAGE_BYTES}s")
+READ_RETRIES = 100
+# How often a reader checks that f1.py has not replaced the file.
+REMAP_INTERVAL = 1.0
+
+
+def snapshot_size(capacity):
+    return HEADER.size + capacity * ENTRY.size
+
+
+def _encode(text, size):
+    # Cut on a character boundary so a long name still decodes.
+    data = str(text).encode()
+    if len(data) > size:
+        data = data[:size].decode(errors="ignore").encode()
+    return data
+
+
+def _encode_image(image):
+    data = str(image).encode()
+    if len(data) > IMAGE_BYTES:
+        print(f"Photo name too long for the board snapshot, shown without it: {image}")
+        return b""
+    return data
+
+
+def _decode(data):
+    return data.rstrip(b"\0").decode(errors="ignore")
+
+
+class SnapshotWriter:
+    # Owned by f1.py. publish() is called with the new top entries whenever
+    # they change; it only rewrites the mapped slots, nothing is flushed to
+    # disk since the file only exists to be shared between the two processes.
+    def __init__(self, path=SNAPSHOT_FILE, capacity=TOP_N):
+        self.path = path
+        self.capacity = capacity
+        self._mm = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        size = snapshot_size(self.capacity)
+        if not self._reusable(size):
+            # Written then renamed so a reader never maps a short file.
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(HEADER.pack(MAGIC, LAYOUT, self.capacity, 0, 0, 0, 0))
+                f.write(bytes(size - HEADER.size))
+            os.replace(tmp, self.path)
+        # An existing file is reused in place, so a display that already has
+        # it mapped keeps seeing updates across f1.py restarts.
+        with open(self.path, "r+b") as f:
+            self._mm = mmap.mmap(f.fileno(), size)
+
+    def _reusable(self, size):
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(HEADER.size)
+                if os.fstat(f.fileno()).st_size != size or len(header) != HEADER.size:
+                    return False
+        except FileNotFoundError:
+            return False
+        magic, layout, capacity = HEADER.unpack(header)[:3]
+        return magic == MAGIC and layout == LAYOUT and capacity == self.capacity
+
+    def publish(self, entries):
+        entries = entries[:self.capacity]
+        with self._lock:
+            if self._mm is None:
+                self._open()
+            mm = self._mm
+            _, _, _, seq, version, _, _ = HEADER.unpack_from(mm, 0)
+            # An odd seq left behind by a crash mid-write is rounded up.
+            seq += (seq & 1) + 1
+            SEQ.pack_into(mm, SEQ_OFFSET, seq)
+            for i, (time_us, name, roll, timestamp, image) in enumerate(entries):
+                ENTRY.pack_into(mm, HEADER.size + i * ENTRY.size, float(time_us),
+                                _encode(name, NAME_BYTES), _encode(roll, ROLL_BYTES),
+                                _encode(timestamp, TIMESTAMP_BYTES), _encode_image(image))
+            HEADER.pack_into(mm, 0, MAGIC, LAYOUT, self.capacity, seq, version + 1, len(entries), 0)
+            SEQ.pack_into(mm, SEQ_OFFSET, seq + 1)
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+
+
+class SnapshotReader:
+    # Read side for leaderboard.py. refresh() is cheap enough to call every
+    # few milliseconds: when nothing was published it is one 8-byte read of
+    # the mapping, plus a stat once every REMAP_INTERVAL.
+    def __init__(self, path=SNAPSHOT_FILE):
+        self.path = path
+        self.version = None
+        self._mm = None
+        self._ino = None
+        self._seq = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+
+    def available(self):
+        with self._lock:
+            return self._map()
+
+    def _map(self):
+        # (Re)maps the file when it was created or replaced since last time.
+        now = time.monotonic()
+        if self._mm is not None and now < self._next_check:
+            return True
+        self._next_check = now + REMAP_INTERVAL
+        try:
+            ino = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+        if ino == self._ino and self._mm is not None:
+            return True
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        try:
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        magic, layout, capacity = HEADER.unpack_from(mm, 0)[:3] if len(mm) >= HEADER.size else (None, None, 0)
+        if magic != MAGIC or layout != LAYOUT or len(mm) < snapshot_size(capacity):
+            mm.close()
+            return False
+        self._mm = mm
+        self._ino = ino
+        self._seq = None
+        return True
+
+    def refresh(self):
+        # Returns the top entries when f1.py published since the last call,
+        # otherwise None.
+        with self._lock:
+            if not self._map():
+                return None
+            mm = self._mm
+            for _ in range(READ_RETRIES):
+                seq = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+                if seq == self._seq:
+                    return None
+                if seq & 1:
+                    time.sleep(0)
+                    continue
+                _, _, capacity, _, version, count, _ = HEADER.unpack_from(mm, 0)
+                slots = [ENTRY.unpack_from(mm, HEADER.size + i * ENTRY.size) for i in range(min(count, capacity))]
+                if SEQ.unpack_from(mm, SEQ_OFFSET)[0] != seq:
+                    continue
+                self._seq = seq
+                self.version = version
+                return [(time_us, _decode(name), _decode(roll), _decode(timestamp), _decode(image))
+                        for time_us, name, roll, timestamp, image in slots]
+            # The writer kept us out; the next call tries again.
+            return None
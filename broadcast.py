@@ -0,0 +1,25 @@
+import threading
+
+
+class Broadcaster:
+    # Holds the latest value with a version number. Any number of listeners
+    # can block until the version moves past the one they last saw.
+    def __init__(self, value=None):
+        self._cond = threading.Condition()
+        self._version = 0
+        self._value = value
+
+    def publish(self, value):
+        with self._cond:
+            self._version += 1
+            self._value = value
+            self._cond.notify_all()
+
+    def current(self):
+        with self._cond:
+            return self._version, self._value
+
+    def wait(self, since, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != since, timeout)
+            return self._version, self._value
@@ -0,0 +1,107 @@
+import collections
+import threading
+import time
+from metrics import Histogram
+from image_pipeline import load_cv2
+
+CAMERA_INDEX = 0
+FRAME_BUFFER = 4
+# Release the device after this long without a picture request or wake().
+IDLE_TIMEOUT = 120
+REOPEN_DELAY = 1.0
+# Many webcams deliver dark or half-exposed frames right after opening.
+WARMUP_FRAMES = 5
+
+read_latency = Histogram("f1_camera_read_seconds", "Time for cv2 to deliver one webcam frame.", ("camera",))
+
+
+class CameraWorker:
+    # Keeps the webcam open on a background thread and holds the last few
+    # frames, so a picture request only has to pick up the freshest one.
+    # A negative index means the rig has no webcam.
+    def __init__(self, index=CAMERA_INDEX, buffer_size=FRAME_BUFFER, idle_timeout=IDLE_TIMEOUT):
+        self.index = index
+        self.idle_timeout = idle_timeout
+        self.frames = collections.deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._last_used = time.monotonic()
+        self._stopped = False
+        self._thread = None
+
+    def wake(self):
+        if self.index < 0:
+            return
+        with self._cond:
+            self._last_used = time.monotonic()
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def latest_frame(self, max_age=0.5, timeout=5.0):
+        if self.index < 0:
+            return None
+        requested = time.monotonic()
+        self.wake()
+        deadline = requested + timeout
+        with self._cond:
+            while True:
+                if self.frames and self.frames[-1][0] >= requested - max_age:
+                    return self.frames[-1][1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _idle(self):
+        return time.monotonic() - self._last_used > self.idle_timeout
+
+    def _run(self):
+        cv2 = load_cv2()
+        cap = None
+        try:
+            while not self._stopped:
+                if self._idle():
+                    if cap is not None:
+                        print("Releasing idle webcam.")
+                        cap.release()
+                        cap = None
+                    with self._cond:
+                        self.frames.clear()
+                        self._cond.wait_for(lambda: self._stopped or not self._idle())
+                    continue
+
+                if cap is None:
+                    cap = cv2.VideoCapture(self.index)
+                    if not cap.isOpened():
+                        print("Could not open webcam!")
+                        cap.release()
+                        cap = None
+                        time.sleep(REOPEN_DELAY)
+                        continue
+                    for _ in range(WARMUP_FRAMES):
+                        cap.read()
+
+                with read_latency.time(camera=self.index):
+                    ret, frame = cap.read()
+                if not ret:
+                    print("Webcam stopped delivering frames, reopening.")
+                    cap.release()
+                    cap = None
+                    time.sleep(REOPEN_DELAY)
+                    continue
+
+                with self._cond:
+                    self.frames.append((time.monotonic(), frame))
+                    self._cond.notify_all()
+        finally:
+            if cap is not None:
+                cap.release()
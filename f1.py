@@ -1,33 +1,62 @@
-import serial
 import json
-from flask import Flask, render_template_string, jsonify, request
+import atexit
+from flask import Flask, Response, jsonify, request, abort, make_response
+import os
 import threading
 import time
-import datetime
-import os
-import cv2
+from leaderboard_store import LeaderboardStore
+from leaderboard_db import SQLiteLeaderboardStore
+from camera import CameraWorker
+from image_pipeline import ImagePipeline
+from image_store import ImageStore
+from attempt_log import AttemptWriter, ATTEMPT_LOG
+from rank_index import RankIndex
+from metrics import Gauge, instrument_app
+from serving import StaticPage, enable_compression, run
+from station import Station, StationRegistry, parse_stations
+from board_snapshot import SNAPSHOT_FILE, SnapshotWriter
 
 PORT = "COM7"
-BAUD = 9600
-ser = None
-try:
-    ser = serial.Serial(PORT, BAUD, timeout=1)
-except serial.SerialException as e:
-    print(f"Error: Could not open serial port {PORT}. Please check the connection and port number.")
-    print(e)
+HTTP_PORT = int(os.environ.get("F1_HTTP_PORT", 5000))
+# Several rigs can share one server and leaderboard, e.g.
+# F1_STATIONS="1=COM7,2=COM8@1:v2" (the optional @N picks the webcam index,
+# @-1 means the rig has no webcam; :v2 selects the binary serial protocol
+# at 115200 baud, see protocol.py).
+STATIONS = parse_stations(os.environ.get("F1_STATIONS", f"1={PORT}"))
+# "file" (leaderboard.txt + leaderboard.log) or "sqlite" (leaderboard.db).
+# leaderboard.py reads the board from the snapshot f1.py publishes (see
+# board_snapshot.py); only without one must it use the same setting.
+LEADERBOARD_BACKEND = os.environ.get("F1_BACKEND", "file")
 
-app = Flask(__name__)
+app = enable_compression(instrument_app(Flask(__name__), "f1"))
 
 # Ensure images folder exists
 IMAGES_DIR = "images"
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
-leaderboard = []
-current_stage = {"type": "landing", "value": None}
-time_shown_until = 0
-last_top_10_rank = None
-temp_new_entry = None
-player_data = {"name": "Player", "roll": "N/A"}
+leaderboard = SQLiteLeaderboardStore() if LEADERBOARD_BACKEND == "sqlite" else LeaderboardStore()
+snapshot = SnapshotWriter() if SNAPSHOT_FILE else None
+# Photos of entries on the board are kept; older ones are pruned by size.
+image_store = ImageStore(IMAGES_DIR, pinned=lambda: {entry[4] for entry in leaderboard.top()})
+image_pipeline = ImagePipeline(image_store)
+attempts = AttemptWriter()
+# Seeded from the log as it is now; attempts.start() in main comes later.
+ranks = RankIndex(ATTEMPT_LOG)
+cameras = {}
+stations = StationRegistry()
+for station_id, (port, camera_index, protocol) in STATIONS.items():
+    if camera_index not in cameras:
+        cameras[camera_index] = CameraWorker(camera_index)
+    stations.add(Station(station_id, port, leaderboard, cameras[camera_index], image_pipeline, attempts, ranks, protocol))
+STREAM_KEEPALIVE = 15
+
+Gauge("f1_serial_queued", "Serial lines waiting for the game logic.",
+      lambda: {(s.id,): s.serial_stats()["queued"] for s in stations}, ("station",))
+Gauge("f1_serial_dropped", "Serial lines dropped because the queue or the held lines were full.",
+      lambda: {(s.id,): s.serial_stats()["dropped"] for s in stations}, ("station",))
+Gauge("f1_leaderboard_entries", "Entries in the leaderboard.", lambda: len(leaderboard))
+Gauge("f1_ranked_attempts", "Attempts in the rank index.", lambda: len(ranks))
+Gauge("f1_image_store_bytes", "Bytes of photos kept in the image store.", lambda: image_store.total_bytes())
 
 HTML = """
 <!doctype html>
@@ -53,69 +82,112 @@ HTML = """
         .msg { font-size: 24px; color: #fff; margin-top: 20px; }
     </style>
     <script>
-        async function refreshPage(){
-            try {
-                let r = await fetch("/stage");
-                if (!r.ok) return;
-                let data = await r.json();
+        // Pages for a particular rig are opened as /?station=<id>.
+        const STATION = new URLSearchParams(window.location.search).get("station");
+        let pollTimer = null;
 
-                // Hide all states
-                document.getElementById('landingState').style.display = 'none';
-                document.getElementById('readyPage').style.display = 'none';
-                document.getElementById('gameState').style.display = 'none';
-                document.getElementById('resultState').style.display = 'none';
+        function stationUrl(path) {
+            if (!STATION) return path;
+            return path + (path.includes("?") ? "&" : "?") + "station=" + encodeURIComponent(STATION);
+        }
 
-                // Show the correct state based on current_stage
-                if(data.type === "landing" || data.type === "idle"){
-                    document.getElementById('landingState').style.display = 'block';
-                }
-                else if(data.type === "ready"){
-                    document.getElementById('readyPage').style.display = 'block';
-                }
-                else if(data.type === "waiting"){
-                    document.getElementById('gameState').style.display = 'block';
-                    document.getElementById('gameText').textContent = 'Waiting for circuit...';
-                }
-                else if(data.type === "countdown"){
-                    document.getElementById('gameState').style.display = 'block';
-                    document.getElementById('gameText').textContent = data.value;
-                }
-                else if(data.type === "time" || data.type === "new_record"){
-                    document.getElementById('resultState').style.display = 'block';
-                    document.getElementById('resultText').textContent = data.value;
-                    if(data.type === "new_record"){
-                        document.getElementById('photoButton').style.display = 'block';
-                    } else {
-                        document.getElementById('photoButton').style.display = 'none';
-                    }
+        function showStage(data) {
+            // Hide all states
+            document.getElementById('landingState').style.display = 'none';
+            document.getElementById('readyPage').style.display = 'none';
+            document.getElementById('gameState').style.display = 'none';
+            document.getElementById('resultState').style.display = 'none';
+
+            // Show the correct state based on current_stage
+            if(data.type === "landing" || data.type === "idle"){
+                document.getElementById('landingState').style.display = 'block';
+            }
+            else if(data.type === "ready"){
+                document.getElementById('readyPage').style.display = 'block';
+            }
+            else if(data.type === "waiting"){
+                document.getElementById('gameState').style.display = 'block';
+                document.getElementById('gameText').textContent = 'Waiting for circuit...';
+            }
+            else if(data.type === "countdown"){
+                document.getElementById('gameState').style.display = 'block';
+                document.getElementById('gameText').textContent = data.value;
+            }
+            else if(data.type === "time" || data.type === "new_record"){
+                document.getElementById('resultState').style.display = 'block';
+                document.getElementById('resultText').textContent = data.value;
+                const standing = data.standing;
+                document.getElementById('rankText').textContent = standing
+                    ? `Rank ${standing.rank} of ${standing.of}`
+                      + (standing.percentile !== null ? ` - faster than ${standing.percentile}% of attempts` : "")
+                      + (standing.new_personal_best ? " - personal best!" : "")
+                    : "";
+                if(data.type === "new_record"){
+                    document.getElementById('photoButton').style.display = 'block';
+                } else {
+                    document.getElementById('photoButton').style.display = 'none';
                 }
+            }
+        }
+
+        async function refreshPage(){
+            try {
+                let r = await fetch(stationUrl("/stage"));
+                if (!r.ok) return;
+                showStage(await r.json());
             } catch (err) {
                 console.error("Error refreshing stage:", err);
             }
         }
 
+        // Stage changes are pushed over server-sent events; polling only
+        // runs while the stream is down.
+        function startPolling() {
+            if (pollTimer === null) {
+                pollTimer = setInterval(refreshPage, 1000);
+            }
+        }
+
+        function stopPolling() {
+            if (pollTimer !== null) {
+                clearInterval(pollTimer);
+                pollTimer = null;
+            }
+        }
+
+        function connectStream() {
+            if (!window.EventSource) {
+                startPolling();
+                return;
+            }
+            const source = new EventSource(stationUrl("/stage/stream"));
+            source.onopen = stopPolling;
+            source.onmessage = (event) => showStage(JSON.parse(event.data));
+            source.onerror = startPolling;
+        }
+
         async function savePlayerInfo() {
             const name = document.getElementById("playerName").value;
             const roll = document.getElementById("playerRoll").value;
             if(name && roll) {
-                await fetch("/player", {
+                await fetch(stationUrl("/player"), {
                     method: "POST",
                     headers: { "Content-Type": "application/json" },
                     body: JSON.stringify({ name, roll })
                 });
                 document.getElementById("savedMsg").textContent = "Info saved! Click 'Start Game' when you are ready.";
-                await fetch("/set_stage/ready");
+                await fetch(stationUrl("/set_stage/ready"));
             } else {
                  document.getElementById("savedMsg").textContent = "Please enter both fields.";
             }
         }
 
         async function startGame() {
-            await fetch("/set_stage/waiting");
+            await fetch(stationUrl("/set_stage/waiting"));
         }
 
         async function takePicture() {
-            const res = await fetch("/take_picture");
+            const res = await fetch(stationUrl("/take_picture"));
             const data = await res.json();
             if (data.status === "success") {
                 alert("Picture saved for your new rank!");
@@ -125,8 +197,10 @@ HTML = """
             }
         }
 
-        setInterval(refreshPage, 1000);
-        window.onload = refreshPage;
+        window.onload = () => {
+            refreshPage();
+            connectStream();
+        };
     </script>
 </head>
 <body>
@@ -152,6 +226,7 @@ HTML = """
 
         <div id="resultState" class="result-state">
             <div class='time' id="resultText"></div>
+            <div class='msg' id="rankText"></div>
             <p>Returning to home screen in 10 seconds...</p>
             <button id="photoButton" class="photo-button" onclick="takePicture()">Click Picture</button>
         </div>
@@ -160,190 +235,104 @@ HTML = """
 </html>
 """
 
-def capture_webcam_image(filename):
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Could not open webcam!")
-        return False
-    ret, frame = cap.read()
-    if ret:
-        cv2.imwrite(os.path.join(IMAGES_DIR, filename), frame)
-        print(f"Webcam image saved to {filename}")
-        return True
-    else:
-        print("Failed to capture webcam image.")
-        return False
-    cap.release()
+index_page = StaticPage(HTML)
+
+def current_station():
+    station = stations.get(request.args.get("station"))
+    if station is None:
+        abort(make_response(jsonify({"status": "error", "message": "Unknown station."}), 404))
+    return station
 
 @app.route("/")
 def index():
-    return render_template_string(HTML)
+    return index_page.response()
+
+@app.route("/stations")
+def list_stations():
+    return jsonify([
+        {"id": station.id, "port": station.port, "stage": station.current_stage}
+        for station in stations
+    ])
 
 @app.route("/player", methods=["POST"])
 def set_player_data():
-    global player_data
     data = request.json
-    player_data["name"] = data.get("name", "Player")
-    player_data["roll"] = data.get("roll", "N/A")
-    print(f"Player data updated: {player_data}")
+    current_station().set_player(data.get("name", "Player"), data.get("roll", "N/A"))
     return jsonify({"status": "success"})
 
 @app.route("/set_stage/<new_stage>")
 def set_stage(new_stage):
-    global current_stage, ser
-    current_stage["type"] = new_stage
-    current_stage["value"] = None
-    
-    if new_stage == "waiting" and ser:
-        try:
-            ser.write(b'S') 
-            print("Sent 'S' to Arduino to start game.")
-        except serial.SerialException as e:
-            print(f"Error writing to serial port: {e}")
-            ser = None
+    if not current_station().set_stage(new_stage):
+        return jsonify({"status": "error", "message": f"Stage {new_stage!r} cannot be set directly."}), 400
     return jsonify({"status": "stage updated", "stage": new_stage})
 
 @app.route("/take_picture")
 def take_picture_route():
-    global temp_new_entry, leaderboard
-    if temp_new_entry:
-        name = temp_new_entry[1].replace(" ", "_")
-        roll = temp_new_entry[2].replace("/", "_")
-        time_us = temp_new_entry[0]
-        filename = f"{name}_{time_us:.0f}.jpg"
-        
-        if capture_webcam_image(filename):
-            new_entry_with_photo = (temp_new_entry[0], temp_new_entry[1], temp_new_entry[2], temp_new_entry[3], filename)
-            
-            existing_leaderboard = []
-            try:
-                with open("leaderboard.txt", "r") as f:
-                    for row in f:
-                        parts = row.strip().split(",", 4)
-                        if len(parts) == 5:
-                            t_us, name, roll, t_stamp, fname = parts
-                            existing_leaderboard.append((float(t_us), name, roll, t_stamp, fname))
-            except FileNotFoundError:
-                pass
-            
-            existing_leaderboard.append(new_entry_with_photo)
-            existing_leaderboard = sorted(existing_leaderboard, key=lambda x: x[0])
-            leaderboard[:] = existing_leaderboard
-            
-            with open("leaderboard.txt", "w") as f:
-                for t in existing_leaderboard:
-                    f.write(f"{t[0]},{t[1]},{t[2]},{t[3]},{t[4]}\n")
-
-            temp_new_entry = None
-            return jsonify({"status": "success"})
-        else:
-            return jsonify({"status": "error", "message": "Webcam not available."}), 500
-    
+    taken = current_station().take_picture()
+    if taken:
+        return jsonify({"status": "success"})
+    if taken is False:
+        return jsonify({"status": "error", "message": "Webcam not available."}), 500
     return jsonify({"status": "error", "message": "No new record to photograph."}), 400
 
 @app.route("/stage")
 def get_stage():
-    global current_stage, time_shown_until, temp_new_entry
-    now = time.time()
-
-    # This is the corrected logic. It will now automatically save the entry
-    # and reset the page after 10 seconds if no picture is taken.
-    if current_stage["type"] in ["time", "new_record"] and now >= time_shown_until:
-        if temp_new_entry is not None:
-            # New entry exists but no photo was taken. Save with a placeholder.
-            existing_leaderboard = []
-            try:
-                with open("leaderboard.txt", "r") as f:
-                    for row in f:
-                        parts = row.strip().split(",", 4)
-                        if len(parts) == 5:
-                            t_us, name, roll, t_stamp, fname = parts
-                            existing_leaderboard.append((float(t_us), name, roll, t_stamp, fname))
-            except FileNotFoundError:
-                pass
-            
-            new_entry_with_placeholder = (temp_new_entry[0], temp_new_entry[1], temp_new_entry[2], temp_new_entry[3], "no_photo.png")
-            existing_leaderboard.append(new_entry_with_placeholder)
-            existing_leaderboard = sorted(existing_leaderboard, key=lambda x: x[0])
-            leaderboard[:] = existing_leaderboard
-
-            with open("leaderboard.txt", "w") as f:
-                for t in existing_leaderboard:
-                    f.write(f"{t[0]},{t[1]},{t[2]},{t[3]},{t[4]}\n")
-
-            temp_new_entry = None
-        
-        current_stage = {"type": "landing", "value": None}
-    
-    return jsonify(current_stage)
-
-def read_serial():
-    global current_stage, time_shown_until, player_data, ser, temp_new_entry
-    while True:
-        if ser is None:
-            time.sleep(2)
-            try:
-                ser = serial.Serial(PORT, BAUD, timeout=1)
-                print(f"Successfully reconnected to serial port {PORT}.")
-            except serial.SerialException as e:
-                print(f"Failed to reconnect: {e}")
-            continue
-
-        if current_stage["type"] in ["time", "new_record"]:
-            time.sleep(0.1)
-            continue
-        
-        try:
-            line = ser.readline().decode(errors="ignore").strip()
-            if not line:
+    return jsonify(current_station().current_stage)
+
+@app.route("/stage/stream")
+def stage_stream():
+    station = current_station()
+
+    def events():
+        version, stage = station.stage_updates.current()
+        yield f"data: {json.dumps(stage)}\n\n"
+        while True:
+            new_version, stage = station.stage_updates.wait(version, STREAM_KEEPALIVE)
+            if new_version == version:
+                yield ": keep-alive\n\n"
                 continue
+            version = new_version
+            yield f"data: {json.dumps(stage)}\n\n"
 
-            if line in ["1", "2", "3"]:
-                current_stage = {"type": "countdown", "value": int(line)}
-            elif line.startswith("{") and line.endswith("}"):
-                data = json.loads(line)
-                if "time_us" in data:
-                    time_val = float(data["time_us"])
-                    time_to_display = f"{time_val / 1000.0:.3f}ms"
-                    
-                    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    existing_leaderboard = []
-                    try:
-                        with open("leaderboard.txt", "r") as f:
-                            for row in f:
-                                parts = row.strip().split(",", 4)
-                                if len(parts) == 5:
-                                    t_us, name, roll, t_stamp, fname = parts
-                                    existing_leaderboard.append((float(t_us), name, roll, t_stamp, fname))
-                    except FileNotFoundError:
-                        pass
-                    
-                    new_entry = (time_val, player_data["name"], player_data["roll"], timestamp, "N/A")
-                    
-                    if len(existing_leaderboard) < 10 or time_val < max(t[0] for t in existing_leaderboard):
-                        temp_new_entry = new_entry
-                        current_stage = {"type": "new_record", "value": time_to_display}
-                    else:
-                        current_stage = {"type": "time", "value": time_to_display}
-
-                    time_shown_until = time.time() + 10
-
-        except (ValueError, json.JSONDecodeError, serial.SerialException) as e:
-            print(f"Error reading serial data: {e}")
-            ser = None
-            continue
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/best/<roll>")
+def player_best(roll):
+    best = ranks.best(roll)
+    if best is None:
+        return jsonify({"status": "error", "message": "No attempts for this roll number."}), 404
+    return jsonify({"roll": roll, "time_us": best, "standing": ranks.rank(best)})
+
+@app.route("/serial_stats")
+def serial_stats():
+    return jsonify(current_station().serial_stats())
+
+def warm_up():
+    # Runs once the server is already accepting requests. A result that
+    # arrives before this finishes loads what it needs itself.
+    started = time.perf_counter()
+    leaderboard.load()
+    ranks.load_attempt_log()
+    print(f"Leaderboard and rank index loaded in {time.perf_counter() - started:.2f}s")
 
 if __name__ == "__main__":
-    if os.path.exists("leaderboard.txt"):
-        try:
-            with open("leaderboard.txt", "r") as f:
-                for row in f:
-                    parts = row.strip().split(",", 4)
-                    if len(parts) == 5:
-                        leaderboard.append(tuple(parts))
-        except:
-            pass
-    
-    threading.Thread(target=read_serial, daemon=True).start()
-    app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
+    atexit.register(leaderboard.close)
+    if snapshot is not None:
+        # Every change to the top-N is mirrored into the shared snapshot.
+        leaderboard.on_top_change = snapshot.publish
+        atexit.register(snapshot.close)
+    for camera in cameras.values():
+        # Imports OpenCV and opens the webcam on the camera's own thread.
+        camera.wake()
+        atexit.register(camera.stop)
+    atexit.register(image_pipeline.shutdown)
+    image_store.start()
+    atexit.register(image_store.stop)
+    attempts.start()
+    atexit.register(attempts.close)
+
+    # Serial ports are opened by the reader threads, with backoff.
+    stations.start()
+    threading.Thread(target=warm_up, daemon=True).start()
+    run(app, HTTP_PORT)
\ No newline at end of file
@@ -0,0 +1,57 @@
+import collections
+import hashlib
+import threading
+from metrics import Counter
+
+IMAGE_CACHE_BYTES = 32 * 1024 * 1024
+
+lookups = Counter("f1_image_cache_lookups_total", "Image cache lookups by result.", ("result",))
+
+
+class CachedImage:
+    __slots__ = ("data", "etag")
+
+    def __init__(self, data):
+        self.data = data
+        self.etag = hashlib.sha1(data).hexdigest()[:16]
+
+
+class ImageCache:
+    # Bounded LRU of image bytes keyed by path. Photos are written once under
+    # a unique name and never rewritten, so a hit is served without touching
+    # the disk at all.
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        with self._lock:
+            item = self._items.get(path)
+            if item is not None:
+                self._items.move_to_end(path)
+                lookups.inc(result="hit")
+                return item
+        try:
+            with open(path, "rb") as f:
+                item = CachedImage(f.read())
+        except (FileNotFoundError, IsADirectoryError):
+            lookups.inc(result="missing")
+            return None
+        lookups.inc(result="miss")
+        if len(item.data) <= self.max_bytes:
+            with self._lock:
+                if path not in self._items:
+                    self._items[path] = item
+                    self._size += len(item.data)
+                while self._size > self.max_bytes:
+                    _, evicted = self._items.popitem(last=False)
+                    self._size -= len(evicted.data)
+        return item
+
+    def discard(self, path):
+        with self._lock:
+            item = self._items.pop(path, None)
+            if item is not None:
+                self._size -= len(item.data)
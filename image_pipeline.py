@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from metrics import Histogram
+
+WORKERS = 2
+JPEG_QUALITY = 90
+# Variants are stored next to each photo in the image store. "thumb" is a square
+# crop sized for the 100px leaderboard circles at 2x density, "display" caps
+# the longest edge for full-screen use.
+THUMB_SIZE = 200
+DISPLAY_SIZE = 640
+VARIANT_QUALITY = 80
+
+save_latency = Histogram("f1_image_save_seconds", "Time to encode and write a photo and its variants.")
+
+
+def load_cv2():
+    # Importing OpenCV takes from hundreds of milliseconds to seconds on the
+    # kiosk boxes, so it is deferred until a camera or photo needs it.
+    # CameraWorker loads it on its own thread when the camera is woken.
+    import cv2
+    return cv2
+
+
+def encode_jpeg(frame, quality=JPEG_QUALITY):
+    cv2 = load_cv2()
+    ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode JPEG")
+    return data.tobytes()
+
+
+def make_thumbnail(frame, size=THUMB_SIZE):
+    cv2 = load_cv2()
+    h, w = frame.shape[:2]
+    side = min(h, w)
+    top, left = (h - side) // 2, (w - side) // 2
+    square = frame[top:top + side, left:left + side]
+    return cv2.resize(square, (size, size), interpolation=cv2.INTER_AREA)
+
+
+def make_display(frame, size=DISPLAY_SIZE):
+    cv2 = load_cv2()
+    h, w = frame.shape[:2]
+    scale = size / max(h, w)
+    if scale >= 1:
+        return frame
+    return cv2.resize(frame, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+
+class ImagePipeline:
+    # Encodes captured frames and their resized variants on a worker pool so
+    # the request that took the picture does not wait for JPEG encoding,
+    # then hands them to the image store.
+    def __init__(self, store, workers=WORKERS):
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+
+    def submit(self, frame, filename):
+        return self._pool.submit(self._process, frame, filename)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+    def _process(self, frame, filename):
+        try:
+            with save_latency.time():
+                variants = {
+                    "thumb": encode_jpeg(make_thumbnail(frame), VARIANT_QUALITY),
+                    "display": encode_jpeg(make_display(frame), VARIANT_QUALITY),
+                }
+                self.store.put(filename, encode_jpeg(frame), variants)
+            print(f"Webcam image saved to {filename}")
+        except (OSError, ValueError, load_cv2().error) as e:
+            print(f"Error saving webcam image {filename}: {e}")
+            raise
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Photos are stored by content under images/blobs/ (with the thumb/display
+# variants alongside), and images/manifest.json maps the names used in
+# leaderboard entries to those blobs. Identical photos share one blob, and
+# each blob counts how many names refer to it. Photos of entries still on
+# the board are never pruned; the rest are kept, newest first, only while
+# they fit in MAX_BYTES and MAX_IMAGES, so images/ stays the same size no
+# matter how many events are run.
+IMAGES_DIR = "images"
+BLOBS_DIR = "blobs"
+MANIFEST_FILE = "manifest.json"
+VARIANTS = ("thumb", "display")
+MAX_BYTES = 256 * 1024 * 1024
+MAX_IMAGES = 200
+PRUNE_INTERVAL = 60
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _blob_path(images_dir, blob, variant=None):
+    if variant:
+        return os.path.join(images_dir, BLOBS_DIR, variant, blob + ".jpg")
+    return os.path.join(images_dir, BLOBS_DIR, blob + ".jpg")
+
+
+def _write_file(path, data):
+    # Write then rename so readers never see a half-written file.
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ImageStore:
+    # Writer side, owned by f1.py. `pinned` returns the image names that
+    # must be kept, normally the photos of the current top-N entries.
+    def __init__(self, images_dir=IMAGES_DIR, pinned=None, max_bytes=MAX_BYTES, max_images=MAX_IMAGES):
+        self.images_dir = images_dir
+        self.pinned = pinned or (lambda: set())
+        self.max_bytes = max_bytes
+        self.max_images = max_images
+        self.manifest_path = os.path.join(images_dir, MANIFEST_FILE)
+        self.images = {}
+        self.blobs = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        for variant in VARIANTS:
+            os.makedirs(os.path.join(images_dir, BLOBS_DIR, variant), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        self.images = manifest.get("images", {})
+        self.blobs = manifest.get("blobs", {})
+        # Reference counts are rebuilt from the names rather than trusted.
+        for blob in self.blobs.values():
+            blob["refs"] = 0
+        for image in list(self.images.values()):
+            blob = self.blobs.get(image["blob"])
+            if blob is not None:
+                blob["refs"] += 1
+
+    def _save(self):
+        _write_file(self.manifest_path, json.dumps({"images": self.images, "blobs": self.blobs}).encode())
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._background, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def put(self, name, original, variants):
+        # original and variants ({variant: bytes}) are encoded JPEGs.
+        blob = content_hash(original)
+        with self._lock:
+            if blob not in self.blobs:
+                size = len(original)
+                _write_file(_blob_path(self.images_dir, blob), original)
+                for variant, data in variants.items():
+                    _write_file(_blob_path(self.images_dir, blob, variant), data)
+                    size += len(data)
+                self.blobs[blob] = {"bytes": size, "refs": 0}
+            previous = self.images.get(name)
+            if previous is not None:
+                self._release(previous["blob"])
+            self.images[name] = {"blob": blob, "created": time.time()}
+            self.blobs[blob]["refs"] += 1
+            self._save()
+        self._wakeup.set()
+        return blob
+
+    def _release(self, blob):
+        info = self.blobs.get(blob)
+        if info is None:
+            return
+        info["refs"] -= 1
+        if info["refs"] <= 0:
+            del self.blobs[blob]
+            _remove(_blob_path(self.images_dir, blob))
+            for variant in VARIANTS:
+                _remove(_blob_path(self.images_dir, blob, variant))
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(blob["bytes"] for blob in self.blobs.values())
+
+    def prune(self):
+        # Drops the oldest photos that are no longer on the board until the
+        # store fits its limits again. Returns the names removed.
+        pinned = self.pinned()
+        removed = []
+        with self._lock:
+            total = sum(blob["bytes"] for blob in self.blobs.values())
+            candidates = sorted((image["created"], name) for name, image in self.images.items() if name not in pinned)
+            for _, name in candidates:
+                if total <= self.max_bytes and len(self.images) <= self.max_images:
+                    break
+                blob = self.images.pop(name)["blob"]
+                info = self.blobs.get(blob)
+                if info is not None and info["refs"] == 1:
+                    total -= info["bytes"]
+                self._release(blob)
+                removed.append(name)
+            if removed:
+                self._save()
+        return removed
+
+    def import_loose_photos(self):
+        # Moves photos written straight into images/ (before the store
+        # existed) into it, so they fall under the same retention.
+        imported = 0
+        for entry in os.scandir(self.images_dir):
+            if not entry.is_file() or not entry.name.lower().endswith(".jpg") or entry.name in self.images:
+                continue
+            with open(entry.path, "rb") as f:
+                original = f.read()
+            variants = {}
+            for variant in VARIANTS:
+                path = os.path.join(self.images_dir, variant, entry.name)
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        variants[variant] = f.read()
+            self.put(entry.name, original, variants)
+            _remove(entry.path)
+            for variant in variants:
+                _remove(os.path.join(self.images_dir, variant, entry.name))
+            imported += 1
+        return imported
+
+    def _background(self):
+        try:
+            imported = self.import_loose_photos()
+            if imported:
+                print(f"Moved {imported} photo(s) into the image store.")
+        except OSError as e:
+            print(f"Error importing photos: {e}")
+        while not self._stopped:
+            self._wakeup.wait(PRUNE_INTERVAL)
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            try:
+                removed = self.prune()
+                if removed:
+                    print(f"Pruned {len(removed)} photo(s) that dropped off the board.")
+            except OSError as e:
+                print(f"Error pruning images: {e}")
+
+
+class ImageIndex:
+    # Read side for leaderboard.py: resolves a photo name to the file to
+    # serve. The manifest is re-read when f1.py replaces it. Names that are
+    # not in it are looked up directly under images/, which covers photos
+    # taken before the store existed.
+    def __init__(self, images_dir=IMAGES_DIR):
+        self.images_dir = images_dir
+        self.manifest_path = os.path.join(images_dir, MANIFEST_FILE)
+        self._images = {}
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.manifest_path)
+            signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            try:
+                with open(self.manifest_path) as f:
+                    images = json.load(f).get("images", {})
+            except (FileNotFoundError, ValueError):
+                images = {}
+            self._images = {name: image["blob"] for name, image in images.items()}
+            self._signature = signature
+
+    def signature(self):
+        # Changes whenever f1.py rewrites the manifest, i.e. stores a photo.
+        self._refresh()
+        return self._signature
+
+    def blob_path(self, name, variant=None):
+        # Path of a stored photo, or None if the manifest does not know it.
+        self._refresh()
+        blob = self._images.get(name)
+        if blob is None:
+            return None
+        return _blob_path(self.images_dir, blob, variant)
@@ -1,50 +1,204 @@
-from flask import Flask, render_template_string, jsonify, send_from_directory
+from flask import Flask, Response, render_template_string, jsonify, request, abort, make_response
+from werkzeug.security import safe_join
 import threading
 import time
+import collections
+import mimetypes
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import os
+from leaderboard_store import LEADERBOARD_FILE, LEADERBOARD_LOG, TOP_N, LeaderboardTail
+from leaderboard_db import SQLiteLeaderboardReader
+from board_snapshot import SNAPSHOT_FILE, SnapshotReader
+from broadcast import Broadcaster
+from image_cache import ImageCache
+from image_store import ImageIndex
+from metrics import Histogram, instrument_app
+from serving import StaticPage, enable_compression, run
+try:
+    # NumPy is only needed for the /stats endpoints.
+    from analytics import AttemptColumns, PERIODS, DEFAULT_PERCENTILES
+except ImportError:
+    AttemptColumns = None
 
-LEADERBOARD_FILE = "leaderboard.txt"
 IMAGES_DIR = "images"
+IMAGE_VARIANTS = ("thumb", "display")
+# One write from f1.py often fires several events; wait this long for the
+# burst to settle before reading.
+RELOAD_DEBOUNCE = 0.05
+# One thread checks the snapshot's seq this often and pushes new board
+# versions to every screen over /data/stream. A check is an 8-byte read; at
+# this rate the thread's wake-ups cost more than the checks themselves.
+# Until f1.py has published a snapshot it is looked for once a second.
+SNAPSHOT_POLL = 0.02
+SNAPSHOT_WAIT = 1
+STREAM_KEEPALIVE = 15
+# Only used when f1.py publishes no snapshot; must then match its F1_BACKEND.
+LEADERBOARD_BACKEND = os.environ.get("F1_BACKEND", "file")
 
-app = Flask(__name__)
+app = enable_compression(instrument_app(Flask(__name__), "leaderboard"))
+
+reload_latency = Histogram("f1_leaderboard_reload_seconds", "Time to pick up a leaderboard change from disk.", ("kind",))
 
 leaderboard_data = []
 last_update_time = 0
 
+# Every change to the top 10 bumps the board version. Recent boards are kept so
+# /data?since=<version> can answer with only the ranks that changed. Starting
+# from the clock keeps versions increasing across restarts.
+BOARD_HISTORY = 32
+board_lock = threading.Lock()
+board_version = int(time.time() * 1000)
+board_history = collections.deque([(board_version, leaderboard_data)], maxlen=BOARD_HISTORY)
+board_updates = Broadcaster(board_version)
+
+image_cache = ImageCache()
+image_index = ImageIndex(IMAGES_DIR)
+snapshot_reader = SnapshotReader(SNAPSHOT_FILE) if SNAPSHOT_FILE else None
+snapshot_active = False
+sqlite_reader = None
+attempt_columns = None
+# Two first /stats requests at once must not both open the analytics columns.
+attempt_columns_lock = threading.Lock()
+
+# Names f1.py saves for entries without a photo; never looked up on disk.
+NO_PHOTO = ("N/A", "", "no_photo.png")
+# Photos that were not found, with the manifest signature and time of the
+# lookup. They are tried again once f1.py stores another photo, or after
+# MISSING_RETRY seconds for files put back by hand.
+MISSING_RETRY = 60
+missing_photos = {}
+
+def has_photo(filename):
+    return filename not in NO_PHOTO
+
+def image_path(filename, size=None):
+    # Photos in f1.py's image store resolve through its manifest; anything
+    # else (older photos) is looked up directly under images/.
+    path = image_index.blob_path(filename, size)
+    if path is None:
+        path = safe_join(IMAGES_DIR, size, filename) if size else safe_join(IMAGES_DIR, filename)
+    return path
+
+def load_image(filename, size=None):
+    # The image pipeline in f1.py writes pre-sized variants next to the
+    # original; fall back to the original until they exist.
+    if size in IMAGE_VARIANTS:
+        path = image_path(filename, size)
+        item = image_cache.get(path) if path else None
+        if item is not None:
+            return item
+    path = image_path(filename)
+    return image_cache.get(path) if path else None
+
+def image_version(filename, signature=None):
+    # Content hash of the thumbnail the display shows; used as ?v= in its URL.
+    if not has_photo(filename):
+        return None
+    if signature is None:
+        signature = image_index.signature()
+    missed = missing_photos.get(filename)
+    if missed is not None and missed[0] == signature and time.monotonic() - missed[1] < MISSING_RETRY:
+        return None
+    item = load_image(filename, "thumb")
+    if item is None:
+        missing_photos[filename] = (signature, time.monotonic())
+        return None
+    missing_photos.pop(filename, None)
+    return item.etag
+
+def refresh_image_versions():
+    # Photos are encoded after their entry is saved, so a version can become
+    # known only after the board was loaded. Publish it as a new board version.
+    global leaderboard_data, board_version
+    board = leaderboard_data
+    pending = [i for i, entry in enumerate(board) if entry['image_version'] is None and has_photo(entry['image'])]
+    for name in list(missing_photos):
+        if not any(entry['image'] == name for entry in board):
+            missing_photos.pop(name, None)
+    if not pending:
+        return
+    signature = image_index.signature()
+    updated = list(board)
+    for i in pending:
+        version = image_version(board[i]['image'], signature)
+        if version:
+            updated[i] = dict(board[i], image_version=version)
+    if updated == board:
+        return
+    with board_lock:
+        if leaderboard_data is board:
+            board_version += 1
+            leaderboard_data = updated
+            board_history.append((board_version, updated))
+            board_updates.publish(board_version)
+
+def publish_board(top):
+    global leaderboard_data, last_update_time, board_version
+    new_leaderboard = [
+        {'time': t[0], 'name': t[1], 'roll': t[2], 'timestamp': t[3], 'image': t[4],
+         'image_version': image_version(t[4])}
+        for t in top
+    ]
+    with board_lock:
+        if new_leaderboard != leaderboard_data:
+            board_version += 1
+            leaderboard_data = new_leaderboard
+            board_history.append((board_version, new_leaderboard))
+            board_updates.publish(board_version)
+        last_update_time = time.time()
+
 class LeaderboardHandler(FileSystemEventHandler):
+    def __init__(self):
+        super().__init__()
+        self.tail = LeaderboardTail(LEADERBOARD_FILE, LEADERBOARD_LOG, top_n=TOP_N)
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        threading.Thread(target=self._debounce, daemon=True).start()
+
     def on_modified(self, event):
-        global leaderboard_data, last_update_time
-        if event.src_path.endswith(LEADERBOARD_FILE):
-            print(f"{LEADERBOARD_FILE} changed, reloading data...")
-            try:
-                with open(LEADERBOARD_FILE, "r") as f:
-                    lines = f.readlines()
-                new_leaderboard = []
-                for line in lines:
-                    parts = line.strip().split(",", 4)
-                    if len(parts) == 5:
-                        try:
-                            time_us = float(parts[0])
-                            name = parts[1]
-                            roll = parts[2]
-                            timestamp = parts[3]
-                            image_file = parts[4]
-                            new_leaderboard.append({'time': time_us, 'name': name, 'roll': roll, 'timestamp': timestamp, 'image': image_file})
-                        except Exception as e:
-                            print(f"Error processing line: {line}. Error: {e}")
-                            pass
-                
-                new_leaderboard.sort(key=lambda x: x['time'])
-                leaderboard_data[:] = new_leaderboard[:10]
-                last_update_time = time.time()
-            except Exception as e:
-                print("Error reading leaderboard:", e)
+        if self.is_leaderboard_file(event.src_path):
+            self._changed.set()
 
-@app.route("/")
-def index():
-    html = """
+    def on_created(self, event):
+        if self.is_leaderboard_file(event.src_path):
+            self._changed.set()
+
+    def on_moved(self, event):
+        # Compaction in f1.py renames the new snapshot and log into place.
+        if self.is_leaderboard_file(event.dest_path):
+            self._changed.set()
+
+    def is_leaderboard_file(self, path):
+        return path.endswith(LEADERBOARD_FILE) or path.endswith(LEADERBOARD_LOG)
+
+    def _debounce(self):
+        while True:
+            self._changed.wait()
+            time.sleep(RELOAD_DEBOUNCE)
+            self._changed.clear()
+            self.reload()
+
+    def reload(self):
+        if snapshot_active:
+            return
+        try:
+            with self._lock:
+                started = time.perf_counter_ns()
+                full_reloads = self.tail.full_reloads
+                changed = self.tail.refresh()
+                top = list(self.tail.top.entries)
+                full = self.tail.full_reloads != full_reloads
+                reload_latency.observe_ns(time.perf_counter_ns() - started, kind="full" if full else "incremental")
+            if full:
+                print(f"{LEADERBOARD_FILE} replaced, reloaded data.")
+            if not changed:
+                return
+            publish_board(top)
+        except Exception as e:
+            print("Error reading leaderboard:", e)
+
+HTML = """
     <!doctype html>
     <html>
     <head>
@@ -64,86 +218,113 @@ def index():
             .player-info p { margin: 2px 0; font-size: 0.9em; }
         </style>
         <script>
+            let boardVersion = null;
+            const shown = [];
+
+            function formatTime(entry) {
+                return (entry.time / 1000).toFixed(3) + ' s';
+            }
+
+            function setPhoto(img, entry, rank) {
+                const hasPhoto = !["N/A", "", "no_photo.png"].includes(entry.image);
+                let src = '/images/no_photo.png';
+                if (hasPhoto) {
+                    src = '/images/' + encodeURIComponent(entry.image) + '?size=thumb';
+                    if (entry.image_version) src += '&v=' + entry.image_version;
+                }
+                if (img.getAttribute('src') === src) return;
+                img.alt = hasPhoto ? "Player photo for rank #" + rank : "No photo available";
+                img.className = hasPhoto ? '' : 'player-photo-placeholder';
+                img.onerror = () => {
+                    img.onerror = null;
+                    img.src = '/images/no_photo.png';
+                    img.alt = "No photo available";
+                    img.className = 'player-photo-placeholder';
+                };
+                img.src = src;
+            }
+
+            function renderRank(rank, entry) {
+                const tableBody = document.getElementById('leaderboardTableBody');
+                const playerCards = document.getElementById('playerCards');
+                let row = tableBody.rows[rank - 1];
+                if (!row) {
+                    row = tableBody.insertRow();
+                    for (let c = 0; c < 4; c++) row.insertCell();
+                }
+                const values = ['#' + rank, formatTime(entry), entry.name, entry.roll];
+                values.forEach((value, c) => { row.cells[c].textContent = value; });
+
+                let card = playerCards.children[rank - 1];
+                if (!card) {
+                    card = document.createElement('div');
+                    card.className = 'player-card';
+                    card.innerHTML = '<img><div class="player-info"><h3></h3><p></p><p></p></div>';
+                    playerCards.appendChild(card);
+                }
+                card.querySelector('h3').textContent = entry.name;
+                const lines = card.querySelectorAll('p');
+                lines[0].textContent = 'Rank #' + rank;
+                lines[1].textContent = 'Time: ' + formatTime(entry);
+                setPhoto(card.querySelector('img'), entry, rank);
+            }
+
+            // Only ranks whose entry differs from what is on screen are touched,
+            // so an unchanged board costs no DOM work and no image requests.
+            function applyChanges(changes, size) {
+                const tableBody = document.getElementById('leaderboardTableBody');
+                const playerCards = document.getElementById('playerCards');
+                if (size === 0) {
+                    shown.length = 0;
+                    tableBody.innerHTML = '<tr><td colspan="4">No times recorded yet</td></tr>';
+                    playerCards.innerHTML = '<p>No photos yet. Be the first!</p>';
+                    return;
+                }
+                if (shown.length === 0) {
+                    tableBody.innerHTML = '';
+                    playerCards.innerHTML = '';
+                }
+                changes.forEach(({rank, entry}) => {
+                    if (JSON.stringify(shown[rank - 1]) === JSON.stringify(entry)) return;
+                    shown[rank - 1] = entry;
+                    renderRank(rank, entry);
+                });
+                while (shown.length > size) {
+                    shown.pop();
+                    tableBody.deleteRow(-1);
+                    playerCards.lastElementChild.remove();
+                }
+            }
+
             async function fetchData() {
                 try {
-                    const res = await fetch('/data');
-                    if (res.ok) {
-                        const data = await res.json();
-                        const tableBody = document.getElementById('leaderboardTableBody');
-                        const playerCards = document.getElementById('playerCards');
-                        
-                        // FIX: Separate table and card rendering for stability
-                        tableBody.innerHTML = '';
-                        playerCards.innerHTML = '';
-
-                        if (data.leaderboard.length === 0) {
-                            tableBody.innerHTML = '<tr><td colspan="4">No times recorded yet</td></tr>';
-                            playerCards.innerHTML = '<p>No photos yet. Be the first!</p>';
-                        } else {
-                            // Render the table first (synchronously)
-                            data.leaderboard.forEach((entry, i) => {
-                                tableBody.innerHTML += `
-                                    <tr>
-                                        <td>#${i+1}</td>
-                                        <td>${(entry.time / 1000).toFixed(3)} s</td>
-                                        <td>${entry.name}</td>
-                                        <td>${entry.roll}</td>
-                                    </tr>`;
-                            });
-
-                            // Then, render the player cards (asynchronously)
-                            const cardPromises = data.leaderboard.map((entry, i) => {
-                                return new Promise(resolve => {
-                                    const cardDiv = document.createElement('div');
-                                    cardDiv.className = 'player-card';
-
-                                    const infoDiv = document.createElement('div');
-                                    infoDiv.className = 'player-info';
-                                    infoDiv.innerHTML = `
-                                        <h3>${entry.name}</h3>
-                                        <p>Rank #${i+1}</p>
-                                        <p>Time: ${(entry.time / 1000).toFixed(3)} s</p>`;
-                                    cardDiv.appendChild(infoDiv);
-
-                                    if (entry.image !== "N/A" && entry.image !== "") {
-                                        const img = new Image();
-                                        img.src = '/images/' + entry.image + '?t=' + new Date().getTime();
-                                        img.alt = "Player photo for rank #" + (i + 1);
-                                        
-                                        img.onload = () => {
-                                            cardDiv.prepend(img);
-                                            resolve(cardDiv);
-                                        };
-                                        img.onerror = () => {
-                                            const placeholder = document.createElement('img');
-                                            placeholder.src = '/images/no_photo.png';
-                                            placeholder.alt = "No photo available";
-                                            placeholder.className = 'player-photo-placeholder';
-                                            cardDiv.prepend(placeholder);
-                                            resolve(cardDiv);
-                                        };
-                                    } else {
-                                        const placeholder = document.createElement('img');
-                                        placeholder.src = '/images/no_photo.png';
-                                        placeholder.alt = "No photo available";
-                                        placeholder.className = 'player-photo-placeholder';
-                                        cardDiv.prepend(placeholder);
-                                        resolve(cardDiv);
-                                    }
-                                });
-                            });
-
-                            Promise.all(cardPromises).then(cards => {
-                                cards.forEach(card => playerCards.appendChild(card));
-                            });
-                        }
+                    const url = boardVersion === null ? '/data' : '/data?since=' + boardVersion;
+                    const res = await fetch(url, { cache: 'no-store' });
+                    if (res.status === 204 || !res.ok) return;
+                    const data = await res.json();
+                    if (data.full) {
+                        const changes = data.leaderboard.map((entry, i) => ({ rank: i + 1, entry }));
+                        applyChanges(changes, data.leaderboard.length);
+                    } else {
+                        applyChanges(data.changes, data.size);
                     }
+                    boardVersion = data.version;
                 } catch(err) {
                     console.error("Error fetching data:", err);
                 }
             }
+            // Board versions are pushed over /data/stream; the poll only
+            // catches up on photos and covers browsers without EventSource.
             setInterval(fetchData, 3000);
-            window.onload = fetchData;
+            window.onload = () => {
+                fetchData();
+                if (window.EventSource) {
+                    const source = new EventSource('/data/stream');
+                    source.onmessage = (event) => {
+                        if (Number(event.data) !== boardVersion) fetchData();
+                    };
+                }
+            };
         </script>
     </head>
     <body>
@@ -174,26 +355,161 @@ def index():
     </body>
     </html>
     """
-    return html
+
+index_page = StaticPage(HTML)
+
+@app.route("/")
+def index():
+    return index_page.response()
+
+def read_snapshot():
+    # True once f1.py's snapshot is the board's source. Until then it is
+    # looked for by follow_snapshot() and on every request, so a display
+    # started before f1.py first published switches over (and stops reading
+    # the files or database).
+    global snapshot_active
+    if snapshot_reader is None:
+        return False
+    if not snapshot_active:
+        if not snapshot_reader.available():
+            return False
+        snapshot_active = True
+        print(f"Reading the leaderboard from {SNAPSHOT_FILE}")
+    # Reads the mapped snapshot only if f1.py published since the last call.
+    top = snapshot_reader.refresh()
+    if top is not None:
+        publish_board(top)
+    return True
+
+def follow_snapshot():
+    while True:
+        time.sleep(SNAPSHOT_POLL if snapshot_active else SNAPSHOT_WAIT)
+        try:
+            read_snapshot()
+        except Exception as e:
+            print("Error reading the leaderboard snapshot:", e)
+
+@app.route("/data/stream")
+def data_stream():
+    # Pushes the board version whenever it changes; the page then fetches
+    # /data?since= for the ranks that changed.
+    def events():
+        version, board = board_updates.current()
+        yield f"data: {board}\n\n"
+        while True:
+            new_version, board = board_updates.wait(version, STREAM_KEEPALIVE)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield f"data: {board}\n\n"
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/data")
 def get_data():
-    global leaderboard_data, last_update_time
-    return jsonify({"leaderboard": leaderboard_data})
+    if not read_snapshot() and sqlite_reader is not None:
+        # Runs the indexed top-10 query only if f1.py committed since the last call.
+        top = sqlite_reader.refresh()
+        if top is not None:
+            publish_board(top)
+    refresh_image_versions()
+    since = request.args.get("since", type=int)
+    with board_lock:
+        version, board = board_version, leaderboard_data
+        previous = next((b for v, b in board_history if v == since), None)
+
+    if since == version:
+        return "", 204
+    if previous is None:
+        return jsonify({"version": version, "full": True, "leaderboard": board})
+
+    changes = [
+        {"rank": i + 1, "entry": entry}
+        for i, entry in enumerate(board)
+        if i >= len(previous) or previous[i] != entry
+    ]
+    return jsonify({"version": version, "full": False, "size": len(board), "changes": changes})
 
 @app.route('/images/<filename>')
 def serve_image(filename):
-    image_path = os.path.join(IMAGES_DIR, filename)
-    if os.path.exists(image_path):
-        return send_from_directory(IMAGES_DIR, filename)
-    return "", 404
+    item = load_image(filename, request.args.get("size"))
+    if item is None:
+        return "", 404
+    # A URL carrying the content hash (?v=) can never change, so browsers may
+    # keep it forever; anything else revalidates against the ETag.
+    immutable = request.args.get("v") == item.etag
+    headers = {
+        "ETag": f'"{item.etag}"',
+        "Cache-Control": "public, max-age=31536000, immutable" if immutable else "no-cache",
+    }
+    if request.if_none_match.contains(item.etag):
+        return "", 304, headers
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return Response(item.data, mimetype=mimetype, headers=headers)
+
+def stats_columns():
+    global attempt_columns
+    if AttemptColumns is None:
+        abort(make_response(jsonify({"error": "analytics needs numpy installed"}), 503))
+    with attempt_columns_lock:
+        if attempt_columns is None:
+            attempt_columns = AttemptColumns()
+    # Picks up attempts f1.py has logged since the last request.
+    attempt_columns.refresh()
+    return attempt_columns
+
+@app.route("/stats")
+def stats_summary():
+    return jsonify(stats_columns().summary())
 
-def start_watcher():
-    event_handler = LeaderboardHandler()
+@app.route("/stats/personal_bests")
+def stats_personal_bests():
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    return jsonify(stats_columns().personal_bests(limit))
+
+@app.route("/stats/percentiles")
+def stats_percentiles():
+    columns = stats_columns()
+    points = request.args.get("p")
+    try:
+        points = [float(p) for p in points.split(",")] if points else DEFAULT_PERCENTILES
+    except ValueError:
+        return jsonify({"error": "p must be a comma separated list of numbers"}), 400
+    if not all(0 <= p <= 100 for p in points):
+        return jsonify({"error": "percentiles must be between 0 and 100"}), 400
+    return jsonify(columns.percentiles(points))
+
+@app.route("/stats/histogram")
+def stats_histogram():
+    bins = request.args.get("bins", 50, type=int)
+    if not 1 <= bins <= 1000:
+        return jsonify({"error": "bins must be between 1 and 1000"}), 400
+    low = request.args.get("min", type=float)
+    high = request.args.get("max", type=float)
+    return jsonify(stats_columns().histogram(bins, low, high))
+
+@app.route("/stats/leaderboard/<period>")
+def stats_period_leaderboard(period):
+    columns = stats_columns()
+    if period not in PERIODS:
+        return jsonify({"error": f"period must be one of {', '.join(sorted(PERIODS))}"}), 404
+    n = request.args.get("n", 10, type=int)
+    if n < 1:
+        return jsonify({"error": "n must be at least 1"}), 400
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    return jsonify(columns.period_leaderboards(period, n, limit))
+
+def start_watcher(event_handler):
     observer = Observer()
     observer.schedule(event_handler, path='.', recursive=False)
     observer.start()
-    print("Started watchdog observer for leaderboard.txt")
+    print(f"Started watchdog observer for {LEADERBOARD_FILE} and {LEADERBOARD_LOG}")
     try:
         while True:
             time.sleep(1)
@@ -202,10 +518,19 @@ def start_watcher():
     observer.join()
 
 if __name__ == "__main__":
-    if os.path.exists(LEADERBOARD_FILE):
-        LeaderboardHandler().on_modified(type('', (), {'src_path': LEADERBOARD_FILE})())
-    
-    watcher_thread = threading.Thread(target=start_watcher, daemon=True)
-    watcher_thread.start()
+    if not read_snapshot():
+        # No snapshot yet: read the backend directly until f1.py publishes one.
+        if LEADERBOARD_BACKEND == "sqlite":
+            sqlite_reader = SQLiteLeaderboardReader()
+            publish_board(sqlite_reader.refresh())
+        else:
+            handler = LeaderboardHandler()
+            handler.reload()
+
+            watcher_thread = threading.Thread(target=start_watcher, args=(handler,), daemon=True)
+            watcher_thread.start()
+
+    if snapshot_reader is not None:
+        threading.Thread(target=follow_snapshot, daemon=True).start()
 
-    app.run(host="0.0.0.0", port=5051, debug=False)
\ No newline at end of file
+    run(app, 5051)
\ No newline at end of file
@@ -0,0 +1,149 @@
+import argparse
+import sqlite3
+import threading
+from leaderboard_store import LEADERBOARD_FILE, LEADERBOARD_LOG, TOP_N, TopK, load_entries
+
+LEADERBOARD_DB = "leaderboard.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leaderboard (
+    id INTEGER PRIMARY KEY,
+    time_us REAL NOT NULL,
+    name TEXT NOT NULL,
+    roll TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    image TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leaderboard_time ON leaderboard (time_us, id);
+CREATE INDEX IF NOT EXISTS leaderboard_roll ON leaderboard (roll);
+"""
+
+TOP_QUERY = "SELECT time_us, name, roll, timestamp, image FROM leaderboard ORDER BY time_us, id LIMIT ?"
+INSERT = "INSERT INTO leaderboard (time_us, name, roll, timestamp, image) VALUES (?, ?, ?, ?, ?)"
+
+
+def connect(path=LEADERBOARD_DB):
+    # WAL lets leaderboard.py read while f1.py writes, without either waiting.
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class SQLiteLeaderboardStore:
+    # Drop-in replacement for LeaderboardStore backed by SQLite. Every result
+    # is its own short transaction; the top-N cut-off is cached in memory so
+    # qualifies() never touches the database. Like LeaderboardStore it loads
+    # on first use if load() was not called, and calls on_top_change(top).
+    def __init__(self, path=LEADERBOARD_DB, top_n=TOP_N):
+        self.path = path
+        self.top_n = top_n
+        self._conn = None
+        self._top = TopK(top_n)
+        self._count = 0
+        self._lock = threading.Lock()
+        self.on_top_change = None
+
+    def load(self):
+        with self._lock:
+            if self._conn is not None:
+                return self
+            self._conn = connect(self.path)
+            self._top.reset(self._conn.execute(TOP_QUERY, (self.top_n,)).fetchall())
+            self._count = self._conn.execute("SELECT COUNT(*) FROM leaderboard").fetchone()[0]
+            self._top_changed()
+        return self
+
+    def _ensure_loaded(self):
+        if self._conn is None:
+            self.load()
+
+    def qualifies(self, time_us):
+        self._ensure_loaded()
+        with self._lock:
+            entries = self._top.entries
+            return len(entries) < self.top_n or time_us < entries[-1][0]
+
+    def add(self, entry):
+        self._ensure_loaded()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(INSERT, entry)
+            if self._top.offer(tuple(entry)):
+                self._top_changed()
+            self._count += 1
+
+    def top(self, n=None):
+        n = n or self.top_n
+        self._ensure_loaded()
+        with self._lock:
+            if n <= self.top_n:
+                return list(self._top.entries[:n])
+            return self._conn.execute(TOP_QUERY, (n,)).fetchall()
+
+    def _top_changed(self):
+        if self.on_top_change is not None:
+            self.on_top_change(list(self._top.entries))
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class SQLiteLeaderboardReader:
+    # Read side for leaderboard.py. PRAGMA data_version only changes when
+    # another connection commits, so checking it is a cheap way to know
+    # whether the indexed top-N query needs to run again.
+    def __init__(self, path=LEADERBOARD_DB, top_n=TOP_N):
+        self.top_n = top_n
+        self._conn = connect(path)
+        self._version = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        # Returns the top entries when the database changed since the last
+        # call, otherwise None.
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._version:
+                return None
+            self._version = version
+            return self._conn.execute(TOP_QUERY, (self.top_n,)).fetchall()
+
+
+def import_text_leaderboard(db_path, snapshot_path=LEADERBOARD_FILE, log_path=LEADERBOARD_LOG, append=False):
+    entries = load_entries(snapshot_path, log_path)
+    conn = connect(db_path)
+    try:
+        existing = conn.execute("SELECT COUNT(*) FROM leaderboard").fetchone()[0]
+        if existing and not append:
+            raise ValueError(f"{db_path} already has {existing} entries; pass --append to add to them")
+        with conn:
+            conn.executemany(INSERT, entries)
+    finally:
+        conn.close()
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import leaderboard.txt (and its log) into the SQLite leaderboard.")
+    parser.add_argument("source", nargs="?", default=LEADERBOARD_FILE)
+    parser.add_argument("--log", default=LEADERBOARD_LOG)
+    parser.add_argument("--db", default=LEADERBOARD_DB)
+    parser.add_argument("--append", action="store_true", help="import even if the database already has entries")
+    args = parser.parse_args()
+    try:
+        count = import_text_leaderboard(args.db, args.source, args.log, args.append)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    print(f"Imported {count} entries into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
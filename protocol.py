@@ -0,0 +1,166 @@
+import collections
+import json
+
+# Wire protocols spoken by arduino_code.ino. Both decoders are incremental:
+# feed() takes whatever bytes the port delivered and returns the complete
+# messages in them, normalised to Message(kind, value, seq):
+#   ("countdown", 3|2|1), ("result", time_us), ("hello", protocol version)
+#
+# v1: ASCII lines at 9600 baud, "3" / "2" / "1" then {"time_us":...}.
+# v2: binary frames at 115200 baud:
+#   0xAA | type | seq | len | payload (len bytes) | CRC-8 of type..payload
+# seq counts up by one per frame (mod 256), so gaps reveal lost frames and
+# the CRC rejects garbled ones. Results carry time_us as a little-endian
+# uint32. The host still starts a game by sending a single 'S'.
+
+Message = collections.namedtuple("Message", "kind value seq")
+
+MAX_LINE = 1024
+
+FRAME_SYNC = 0xAA
+MSG_HELLO = 0x01
+MSG_COUNTDOWN = 0x02
+MSG_RESULT = 0x03
+MAX_PAYLOAD = 16
+FRAME_OVERHEAD = 5
+
+
+def _crc8_table(poly=0x07):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data):
+    # CRC-8/SMBUS (poly 0x07, init 0), the same bitwise loop the firmware runs.
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def encode_frame(msg_type, seq, payload=b""):
+    body = bytes((msg_type, seq & 0xFF, len(payload))) + payload
+    return bytes((FRAME_SYNC,)) + body + bytes((crc8(body),))
+
+
+class LineDecoder:
+    version = 1
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.errors = 0
+        self.lost = 0
+
+    def reset(self):
+        self.buffer.clear()
+
+    def feed(self, data):
+        self.buffer += data
+        messages = []
+        while True:
+            end = self.buffer.find(b"\n")
+            if end < 0:
+                break
+            line = self.buffer[:end].decode(errors="ignore").strip()
+            del self.buffer[:end + 1]
+            if line:
+                message = self.parse(line)
+                if message is not None:
+                    messages.append(message)
+        if len(self.buffer) > MAX_LINE:
+            self.buffer.clear()
+        return messages
+
+    def parse(self, line):
+        if line in ["1", "2", "3"]:
+            return Message("countdown", int(line), None)
+        if line.startswith("{") and line.endswith("}"):
+            try:
+                data = json.loads(line)
+                if "time_us" in data:
+                    return Message("result", float(data["time_us"]), None)
+            except (ValueError, TypeError) as e:
+                self.errors += 1
+                print(f"Error parsing serial data {line!r}: {e}")
+        return None
+
+
+class FrameDecoder:
+    version = 2
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.errors = 0
+        self.lost = 0
+        self._last_seq = None
+
+    def reset(self):
+        self.buffer.clear()
+        self._last_seq = None
+
+    def feed(self, data):
+        self.buffer += data
+        messages = []
+        buffer = self.buffer
+        while True:
+            start = buffer.find(FRAME_SYNC)
+            if start < 0:
+                buffer.clear()
+                break
+            if start:
+                # Bytes before a sync byte belong to no frame.
+                self.errors += 1
+                del buffer[:start]
+            if len(buffer) < 4:
+                break
+            length = buffer[3]
+            if length > MAX_PAYLOAD:
+                # Not a real header; look for the next sync byte.
+                self.errors += 1
+                del buffer[:1]
+                continue
+            end = length + FRAME_OVERHEAD
+            if len(buffer) < end:
+                break
+            if crc8(buffer[1:end - 1]) != buffer[end - 1]:
+                self.errors += 1
+                del buffer[:1]
+                continue
+            msg_type, seq = buffer[1], buffer[2]
+            payload = bytes(buffer[4:end - 1])
+            del buffer[:end]
+            self._check_seq(msg_type, seq)
+            message = self.parse(msg_type, seq, payload)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    def _check_seq(self, msg_type, seq):
+        if self._last_seq is not None and msg_type != MSG_HELLO:
+            self.lost += (seq - self._last_seq - 1) & 0xFF
+        self._last_seq = seq
+
+    def parse(self, msg_type, seq, payload):
+        if msg_type == MSG_COUNTDOWN and len(payload) == 1:
+            return Message("countdown", payload[0], seq)
+        if msg_type == MSG_RESULT and len(payload) == 4:
+            return Message("result", float(int.from_bytes(payload, "little")), seq)
+        if msg_type == MSG_HELLO and len(payload) == 1:
+            return Message("hello", payload[0], seq)
+        self.errors += 1
+        return None
+
+
+PROTOCOLS = {
+    "v1": (9600, LineDecoder),
+    "v2": (115200, FrameDecoder),
+}
+DEFAULT_PROTOCOL = "v1"
@@ -0,0 +1,158 @@
+import bisect
+import itertools
+import os
+import threading
+from attempt_log import ATTEMPT_LOG, read_attempts
+
+# Reaction times are bucketed by BUCKET_US; a Fenwick tree over the bucket
+# counts gives "how many attempts fall in earlier buckets" in O(log buckets)
+# and a sorted list per bucket resolves the exact position inside one.
+# Anything slower than MAX_TIME_US shares the last bucket.
+BUCKET_US = 1000
+MAX_TIME_US = 10_000_000
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+class RankIndex:
+    # With a source attempt log, the index is seeded from it by
+    # load_attempt_log() or on first use, whichever comes first. Only the
+    # part of the log that existed when the index was created is read:
+    # anything appended later also reaches add(), and would count twice.
+    # So create the index before the AttemptWriter starts.
+    def __init__(self, source=None, bucket_us=BUCKET_US, max_time_us=MAX_TIME_US):
+        self.source = source
+        self._source_end = _file_size(source) if source is not None else None
+        self.bucket_us = bucket_us
+        self.buckets = max_time_us // bucket_us + 1
+        self.total = 0
+        self._tree = [0] * (self.buckets + 1)
+        self._bucket_times = [None] * self.buckets
+        self._best_by_roll = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def _bucket(self, time_us):
+        return min(max(int(time_us // self.bucket_us), 0), self.buckets - 1)
+
+    def _count_before(self, bucket):
+        # Attempts in buckets [0, bucket).
+        count = 0
+        while bucket > 0:
+            count += self._tree[bucket]
+            bucket -= bucket & -bucket
+        return count
+
+    def _insert(self, time_us, roll):
+        bucket = self._bucket(time_us)
+        times = self._bucket_times[bucket]
+        if times is None:
+            times = self._bucket_times[bucket] = []
+        bisect.insort(times, time_us)
+        i = bucket + 1
+        while i <= self.buckets:
+            self._tree[i] += 1
+            i += i & -i
+        self.total += 1
+        best = self._best_by_roll.get(roll)
+        if best is None or time_us < best:
+            self._best_by_roll[roll] = time_us
+
+    def load(self, attempts):
+        # attempts: iterable of (time_us, roll). Builds the tree in one pass
+        # instead of one O(log n) update per attempt.
+        with self._lock:
+            counts = [0] * self.buckets
+            for time_us, roll in attempts:
+                bucket = self._bucket(time_us)
+                times = self._bucket_times[bucket]
+                if times is None:
+                    times = self._bucket_times[bucket] = []
+                times.append(time_us)
+                counts[bucket] += 1
+                best = self._best_by_roll.get(roll)
+                if best is None or time_us < best:
+                    self._best_by_roll[roll] = time_us
+            for times in self._bucket_times:
+                if times:
+                    times.sort()
+            tree = [0] + counts
+            for i in range(1, self.buckets + 1):
+                parent = i + (i & -i)
+                if parent <= self.buckets:
+                    tree[parent] += tree[i]
+            self._tree = tree
+            self.total = sum(counts)
+        return self
+
+    def load_attempt_log(self, path=None):
+        with self._load_lock:
+            if not self._loaded:
+                attempts = read_attempts(path or self.source or ATTEMPT_LOG)
+                if path is None and self._source_end is not None:
+                    attempts = itertools.takewhile(lambda item: item[1] <= self._source_end, attempts)
+                self.load((attempt[0], attempt[2]) for attempt, _ in attempts)
+                self._loaded = True
+        return self
+
+    def _ensure_loaded(self):
+        if not self._loaded and self.source is not None:
+            self.load_attempt_log()
+
+    def _rank(self, time_us):
+        bucket = self._bucket(time_us)
+        times = self._bucket_times[bucket] or []
+        before = self._count_before(bucket)
+        return before + bisect.bisect_left(times, time_us), before + bisect.bisect_right(times, time_us)
+
+    def rank(self, time_us):
+        # Rank a time against the recorded attempts without adding it. A time
+        # that is already recorded is ranked against the others, as add() did,
+        # so both report the same standing for it.
+        self._ensure_loaded()
+        with self._lock:
+            faster, not_slower = self._rank(time_us)
+            if not_slower > faster:
+                standing = self._describe(faster, not_slower - 1, self.total - 1)
+            else:
+                standing = self._describe(faster, not_slower, self.total)
+            standing["of"] = self.total
+            return standing
+
+    def add(self, time_us, roll):
+        # Records an attempt and returns its standing among every attempt so far.
+        self._ensure_loaded()
+        with self._lock:
+            previous_best = self._best_by_roll.get(roll)
+            # Ranked against the attempts before it, so ties share a rank.
+            faster, not_slower = self._rank(time_us)
+            standing = self._describe(faster, not_slower, self.total)
+            self._insert(time_us, roll)
+            standing["of"] = self.total
+            standing["personal_best"] = self._best_by_roll[roll]
+            standing["new_personal_best"] = previous_best is None or time_us < previous_best
+            return standing
+
+    def best(self, roll):
+        self._ensure_loaded()
+        return self._best_by_roll.get(roll)
+
+    @staticmethod
+    def _describe(faster, not_slower, total):
+        # rank 1 is the fastest; percentile is the share of the other
+        # attempts this time beat outright, or None when there are none.
+        slower = total - not_slower
+        return {
+            "rank": faster + 1,
+            "of": total,
+            "percentile": round(100.0 * slower / total, 2) if total else None,
+        }
+
+    def __len__(self):
+        return self.total
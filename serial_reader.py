@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+import serial
+from protocol import LineDecoder
+
+QUEUE_SIZE = 256
+# After a failed open or a lost connection the delay doubles up to the maximum.
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 8
+
+
+class LatencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_ns = 0
+        self.last_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns):
+        with self._lock:
+            self.count += 1
+            self.total_ns += ns
+            self.last_ns = ns
+            self.max_ns = max(self.max_ns, ns)
+
+    def snapshot(self):
+        with self._lock:
+            mean = self.total_ns / self.count if self.count else 0
+            return {
+                "count": self.count,
+                "last_us": self.last_ns / 1000,
+                "mean_us": mean / 1000,
+                "max_us": self.max_ns / 1000,
+            }
+
+
+class SerialReader:
+    # Owns the serial port. The reader thread only decodes messages (see
+    # protocol.py), stamps them with the host clock on arrival and puts them
+    # on the bounded `messages` queue; game logic happens on whichever thread
+    # consumes it. on_ready(), if given, is called after each put so that
+    # thread can be woken instead of polling.
+    # The port is opened by the reader thread, so a missing or slow device
+    # never holds up startup.
+    def __init__(self, port, baud, queue_size=QUEUE_SIZE, on_ready=None, decoder=None):
+        self.port = port
+        self.baud = baud
+        self.messages = queue.Queue(maxsize=queue_size)
+        self.on_ready = on_ready
+        self.decoder = decoder or LineDecoder()
+        self.dropped = 0
+        self.ser = None
+        self.connected = threading.Event()
+        self._write_lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def write(self, data):
+        ser = self.ser
+        if ser is None:
+            return False
+        try:
+            with self._write_lock:
+                ser.write(data)
+            return True
+        except serial.SerialException as e:
+            print(f"Error writing to serial port: {e}")
+            self.ser = None
+            return False
+
+    def _put(self, item):
+        # Never block the reader: when the consumer falls behind, the oldest
+        # line is dropped to make room.
+        while True:
+            try:
+                self.messages.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.messages.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _connect(self, first):
+        try:
+            self.ser = serial.Serial(self.port, self.baud, timeout=1)
+        except serial.SerialException as e:
+            if first:
+                print(f"Error: Could not open serial port {self.port}. Please check the connection and port number.")
+                print(e)
+            else:
+                print(f"Failed to reconnect: {e}")
+            return False
+        if not first:
+            print(f"Successfully reconnected to serial port {self.port}.")
+        self.decoder.reset()
+        self.connected.set()
+        return True
+
+    def _run(self):
+        first = True
+        failures = 0
+        while True:
+            ser = self.ser
+            if ser is None:
+                self.connected.clear()
+                if failures:
+                    time.sleep(min(RECONNECT_DELAY * 2 ** (failures - 1), MAX_RECONNECT_DELAY))
+                failures = 0 if self._connect(first) else failures + 1
+                first = False
+                continue
+
+            try:
+                chunk = ser.read(ser.in_waiting or 1)
+            except (serial.SerialException, OSError) as e:
+                print(f"Error reading serial data: {e}")
+                self.ser = None
+                failures = 1
+                continue
+            if not chunk:
+                continue
+
+            arrived_ns = time.perf_counter_ns()
+            for message in self.decoder.feed(chunk):
+                self._put((arrived_ns, message))
+                if self.on_ready is not None:
+                    self.on_ready()
@@ -0,0 +1,77 @@
+import gzip
+import hashlib
+import os
+from flask import Response, request
+
+# Serving helpers shared by f1.py and leaderboard.py.
+#
+# Both apps keep their state in memory (serial ports, the stage machines,
+# the board history), so "production" means one process with many threads
+# rather than several worker processes. With F1_PRODUCTION=1 they run under
+# waitress when it is installed; otherwise the threaded Flask server is used.
+PRODUCTION = os.environ.get("F1_PRODUCTION", "") not in ("", "0")
+# Every open /stage/stream holds a thread, so leave plenty for screens and phones.
+SERVER_THREADS = int(os.environ.get("F1_THREADS", 64))
+# Below this a gzip header costs about as much as it saves.
+GZIP_MIN_BYTES = 512
+GZIP_LEVEL = 6
+COMPRESSIBLE = ("application/json", "text/html")
+
+
+def accepts_gzip():
+    return "gzip" in request.headers.get("Accept-Encoding", "")
+
+
+class StaticPage:
+    # A page whose HTML never changes: encoded, gzipped and hashed once.
+    def __init__(self, html, mimetype="text/html"):
+        self.mimetype = mimetype
+        self.body = html.encode()
+        self.gzipped = gzip.compress(self.body, GZIP_LEVEL)
+        self.etag = hashlib.sha1(self.body).hexdigest()[:16]
+
+    def response(self):
+        headers = {"ETag": f'"{self.etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if request.if_none_match.contains(self.etag):
+            return Response(status=304, headers=headers)
+        if accepts_gzip():
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzipped, mimetype=self.mimetype, headers=headers)
+        return Response(self.body, mimetype=self.mimetype, headers=headers)
+
+
+def enable_compression(app):
+    # Adds an ETag (answering 304 on a match) and gzip to buffered JSON and
+    # HTML responses. Streams such as /stage/stream are left alone.
+    @app.after_request
+    def _compress(response):
+        if (request.method != "GET" or response.status_code != 200 or response.is_streamed
+                or response.direct_passthrough or response.mimetype not in COMPRESSIBLE
+                or "Content-Encoding" in response.headers):
+            return response
+        if "ETag" not in response.headers:
+            response.add_etag()
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+        data = response.get_data()
+        response.vary.add("Accept-Encoding")
+        if len(data) >= GZIP_MIN_BYTES and accepts_gzip():
+            response.set_data(gzip.compress(data, GZIP_LEVEL))
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+
+    return app
+
+
+def run(app, port):
+    if PRODUCTION:
+        try:
+            from waitress import serve
+        except ImportError:
+            print("waitress is not installed; falling back to the threaded Flask server.")
+        else:
+            print(f"Serving on port {port} with waitress ({SERVER_THREADS} threads).")
+            serve(app, host="0.0.0.0", port=port, threads=SERVER_THREADS)
+            return
+    app.run(host="0.0.0.0", port=port, debug=False, threaded=True)
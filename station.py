@@ -0,0 +1,338 @@
+import collections
+import datetime
+import hashlib
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from broadcast import Broadcaster
+from serial_reader import SerialReader, LatencyStats, QUEUE_SIZE
+from protocol import PROTOCOLS, DEFAULT_PROTOCOL
+from metrics import Counter, Histogram
+
+RESULT_SECONDS = 10
+SERIAL_LATENCY_BUDGET_MS = 5
+RESULT_STAGES = ["time", "new_record"]
+HELD_LINES = QUEUE_SIZE
+# Longer than the camera's own frame timeout, so this only trips if the
+# loop itself is stuck.
+PICTURE_TIMEOUT = 10
+# Longer player names are shortened (and made unique with a hash) in photo
+# file names, which must fit board_snapshot.IMAGE_BYTES.
+PHOTO_NAME_BYTES = 64
+
+serial_to_stage = Histogram("f1_serial_to_stage_seconds", "Time from a serial line arriving to the stage change it causes.", ("station",))
+results = Counter("f1_results_total", "Reaction times received, by whether they made the board.", ("station", "stage"))
+persist_latency = Histogram("f1_persist_seconds", "Time to add a result to the leaderboard.", ("station",))
+capture_latency = Histogram("f1_capture_seconds", "Time to get a fresh webcam frame for a photo.", ("station",))
+captures = Counter("f1_captures_total", "Photo requests by outcome.", ("station", "outcome"))
+
+
+class Station:
+    # One Arduino rig: its serial port, its stage machine and the player
+    # currently at it. All of the station's state belongs to a single event
+    # loop thread: serial lines, HTTP commands and timers are all delivered
+    # to it through one queue, so nothing else ever mutates the state and no
+    # locks are needed. HTTP handlers read current_stage, which is replaced
+    # (never modified) on every change, or post commands and wait for a reply.
+    # A slow or disconnected rig never holds up the others.
+    def __init__(self, station_id, port, leaderboard, camera, image_pipeline, attempts, ranks, protocol=DEFAULT_PROTOCOL):
+        self.id = station_id
+        self.port = port
+        self.leaderboard = leaderboard
+        self.camera = camera
+        self.image_pipeline = image_pipeline
+        self.attempts = attempts
+        self.ranks = ranks
+        self._inbox = queue.Queue()
+        self.protocol = protocol
+        baud, decoder = PROTOCOLS[protocol]
+        # Serial messages wait on the reader's bounded queue (the oldest is
+        # dropped when it is full); the loop is only posted a wake-up to drain it.
+        self.serial_reader = SerialReader(port, baud, on_ready=self._on_serial_ready, decoder=decoder())
+        self._drain_posted = False
+        # Time from a message arriving on the serial port to the stage change it causes.
+        self.serial_latency = LatencyStats()
+        self.current_stage = {"type": "landing", "value": None}
+        self.stage_updates = Broadcaster(self.current_stage)
+        self.temp_new_entry = None
+        self.player_data = {"name": "Player", "roll": "N/A"}
+        # Lines that arrive while a result is on screen wait here until it expires.
+        self._held = collections.deque(maxlen=HELD_LINES)
+        self._held_dropped = 0
+        self._result_id = 0
+        self._timers = []
+        self._timer_seq = itertools.count()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self.serial_reader.start()
+        return self
+
+    # Called from other threads.
+
+    def post(self, fn, *args):
+        self._inbox.put((fn, args, None))
+
+    def call(self, fn, *args):
+        reply = Future()
+        self._inbox.put((fn, args, reply))
+        return reply
+
+    def set_player(self, name, roll):
+        self.post(self._set_player, name, roll)
+
+    def set_stage(self, new_stage):
+        # Result stages only come from the rig: they need an entry and an
+        # expiry timer, which a stage set from a URL would not have.
+        if new_stage in RESULT_STAGES:
+            return False
+        self.post(self._set_stage, new_stage)
+        return True
+
+    def take_picture(self):
+        # Returns None when there is no new record to photograph, False when
+        # the webcam could not deliver a frame or saving failed, and True once
+        # the photo is queued.
+        done = Future()
+        self.post(self._take_picture, done)
+        try:
+            return done.result(timeout=PICTURE_TIMEOUT)
+        except Exception as e:
+            print(f"Photo on station {self.id} failed: {e!r}")
+            return False
+
+    def serial_stats(self):
+        stats = self.serial_latency.snapshot()
+        stats["queued"] = self.serial_reader.messages.qsize()
+        stats["held"] = len(self._held)
+        stats["dropped"] = self.serial_reader.dropped + self._held_dropped
+        stats["protocol"] = self.protocol
+        stats["decode_errors"] = self.serial_reader.decoder.errors
+        stats["lost_frames"] = self.serial_reader.decoder.lost
+        return stats
+
+    def _on_serial_ready(self):
+        # Runs on the serial reader thread. One pending drain is enough; a
+        # message that races with it at worst costs an extra, empty drain.
+        if not self._drain_posted:
+            self._drain_posted = True
+            self.post(self._drain_serial)
+
+    # Everything below runs on the event loop thread.
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._timers:
+                timeout = max(0, self._timers[0][0] - time.monotonic())
+            try:
+                fn, args, reply = self._inbox.get(timeout=timeout)
+            except queue.Empty:
+                pass
+            else:
+                self._dispatch(fn, args, reply)
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                _, _, fn, args = heapq.heappop(self._timers)
+                self._dispatch(fn, args, None)
+
+    def _dispatch(self, fn, args, reply):
+        try:
+            result = fn(*args)
+        except Exception as e:
+            print(f"Error on station {self.id} in {fn.__name__}: {e}")
+            if reply is not None:
+                reply.set_exception(e)
+            return
+        if reply is not None:
+            reply.set_result(result)
+
+    def _schedule(self, delay, fn, *args):
+        heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_seq), fn, args))
+
+    def update_stage(self, stage_type, value=None, **extra):
+        self.current_stage = {"type": stage_type, "value": value, **extra}
+        self.stage_updates.publish(self.current_stage)
+
+    def _drain_serial(self):
+        self._drain_posted = False
+        while True:
+            try:
+                arrived_ns, message = self.serial_reader.messages.get_nowait()
+            except queue.Empty:
+                return
+            self._serial_message(arrived_ns, message)
+
+    def _set_player(self, name, roll):
+        self.player_data = {"name": name, "roll": roll}
+        print(f"Station {self.id} player data updated: {self.player_data}")
+
+    def _set_stage(self, new_stage):
+        self.update_stage(new_stage)
+        if new_stage == "waiting" and self.serial_reader.write(b'S'):
+            print(f"Sent 'S' to Arduino on station {self.id} to start game.")
+
+    def save_entry(self, entry):
+        with persist_latency.time(station=self.id):
+            self.leaderboard.add(entry)
+
+    def _expire_result(self, result_id):
+        # Automatically save the entry and reset the page RESULT_SECONDS
+        # after a result if no picture was taken.
+        if result_id != self._result_id:
+            return
+        if self.temp_new_entry is not None:
+            # New entry exists but no photo was taken. Save with a placeholder.
+            t = self.temp_new_entry
+            self.save_entry((t[0], t[1], t[2], t[3], "no_photo.png"))
+            self.temp_new_entry = None
+        if self.current_stage["type"] in RESULT_STAGES:
+            self.update_stage("landing")
+        # Replay whatever the rig sent while the result was on screen.
+        while self._held and self.current_stage["type"] not in RESULT_STAGES:
+            self._serial_message(*self._held.popleft(), held=True)
+
+    def _take_picture(self, done):
+        entry = self.temp_new_entry
+        self.temp_new_entry = None
+        if entry is None:
+            done.set_result(None)
+            return
+        # Waiting for a frame can take seconds, so it happens off the loop.
+        threading.Thread(target=self._capture, args=(entry, self._result_id, done), daemon=True).start()
+
+    def _capture(self, entry, result_id, done):
+        frame = None
+        try:
+            with capture_latency.time(station=self.id):
+                frame = self.camera.latest_frame()
+        except Exception as e:
+            print(f"Error capturing webcam image on station {self.id}: {e}")
+        captures.inc(station=self.id, outcome="failed" if frame is None else "ok")
+        self.post(self._picture_taken, entry, result_id, frame, done)
+
+    def _picture_taken(self, entry, result_id, frame, done):
+        # done is always resolved, so take_picture() never waits on a failure.
+        try:
+            done.set_result(self._save_picture(entry, result_id, frame))
+        except Exception as e:
+            done.set_exception(e)
+            raise
+
+    def _save_picture(self, entry, result_id, frame):
+        if frame is None:
+            print("Failed to capture webcam image.")
+            if result_id == self._result_id and self.current_stage["type"] == "new_record" and self.temp_new_entry is None:
+                # Still on screen: let the timeout save it as before.
+                self.temp_new_entry = entry
+            else:
+                self.save_entry((entry[0], entry[1], entry[2], entry[3], "no_photo.png"))
+            return False
+
+        filename = photo_filename(entry[1], entry[0])
+        # Encoding and thumbnailing happen on the pipeline's worker threads.
+        self.image_pipeline.submit(frame, filename)
+        self.save_entry((entry[0], entry[1], entry[2], entry[3], filename))
+        return True
+
+    def handle_message(self, message):
+        if message.kind == "countdown":
+            self.update_stage("countdown", message.value)
+        elif message.kind == "hello":
+            print(f"Station {self.id} rig speaks protocol v{message.value}.")
+        elif message.kind == "result":
+            time_val = message.value
+            time_to_display = f"{time_val / 1000.0:.3f}ms"
+            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            new_entry = (time_val, self.player_data["name"], self.player_data["roll"], timestamp, "N/A")
+            # Every run goes to the attempt log, whether or not it makes the board.
+            self.attempts.record(time_val, new_entry[1], new_entry[2], self.id)
+            standing = self.ranks.add(time_val, new_entry[2])
+
+            self._result_id += 1
+            self._schedule(RESULT_SECONDS, self._expire_result, self._result_id)
+            if self.leaderboard.qualifies(time_val):
+                self.temp_new_entry = new_entry
+                # Have the camera warm by the time "Click Picture" is pressed.
+                self.camera.wake()
+                self.update_stage("new_record", time_to_display, standing=standing)
+            else:
+                self.update_stage("time", time_to_display, standing=standing)
+            results.inc(station=self.id, stage=self.current_stage["type"])
+
+    def _serial_message(self, arrived_ns, message, held=False):
+        if self.current_stage["type"] in RESULT_STAGES:
+            # A result stays on screen until it expires; hold further serial
+            # messages until then instead of overwriting an unsaved entry.
+            if len(self._held) == self._held.maxlen:
+                self._held_dropped += 1
+            self._held.append((arrived_ns, message))
+            return
+        self.handle_message(message)
+
+        if held:
+            return
+        latency_ns = time.perf_counter_ns() - arrived_ns
+        self.serial_latency.record(latency_ns)
+        serial_to_stage.observe_ns(latency_ns, station=self.id)
+        if latency_ns > SERIAL_LATENCY_BUDGET_MS * 1_000_000:
+            print(f"Serial message {message} on station {self.id} took {latency_ns / 1e6:.1f}ms to reach the stage")
+
+
+def photo_filename(name, time_us):
+    name = name.replace(" ", "_")
+    data = name.encode()
+    if len(data) > PHOTO_NAME_BYTES:
+        digest = hashlib.sha1(data).hexdigest()[:10]
+        name = data[:PHOTO_NAME_BYTES - len(digest) - 1].decode(errors="ignore") + "_" + digest
+    return f"{name}_{time_us:.0f}.jpg"
+
+
+def parse_stations(spec):
+    # "1=COM7,2=COM8@1:v2" -> {"1": ("COM7", 0, "v1"), "2": ("COM8", 1, "v2")};
+    # the optional @N picks the webcam index for that rig and :v1/:v2 the
+    # serial protocol its firmware was built with.
+    stations = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        station_id, _, port = item.partition("=")
+        if not port:
+            station_id, port = str(len(stations) + 1), station_id
+        # Only a known protocol counts as a suffix: device paths such as
+        # /dev/serial/by-path/...-usb-0:2:1.0 contain colons of their own.
+        head, _, protocol = port.rpartition(":")
+        if head and protocol.strip() in PROTOCOLS:
+            port, protocol = head, protocol.strip()
+        else:
+            protocol = DEFAULT_PROTOCOL
+        port, _, camera_index = port.partition("@")
+        stations[station_id.strip()] = (port.strip(), int(camera_index or 0), protocol)
+    return stations
+
+
+class StationRegistry:
+    def __init__(self):
+        self.stations = {}
+
+    def add(self, station):
+        self.stations[station.id] = station
+        return station
+
+    def get(self, station_id=None):
+        # Requests without a station id go to the first configured rig, so a
+        # single-rig setup keeps working with the original URLs.
+        if station_id is None:
+            return next(iter(self.stations.values()), None)
+        return self.stations.get(station_id)
+
+    def start(self):
+        for station in self.stations.values():
+            station.start()
+
+    def __iter__(self):
+        return iter(self.stations.values())